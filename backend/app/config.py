@@ -0,0 +1,76 @@
+# backend/app/config.py
+# Application settings, read from the environment once at import time
+
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+# Parse the .env file exactly once per process; variables that are already
+# set in the environment (Docker, ECS task definitions) take precedence.
+load_dotenv()
+
+
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes")
+
+
+def _env_origins(name: str, default: str) -> frozenset:
+    """Split a comma separated origin list into a normalized frozenset."""
+    return frozenset(
+        origin.strip().rstrip("/")
+        for origin in os.getenv(name, default).split(",")
+        if origin.strip()
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    environment: str
+    debug: bool
+    log_level: str
+    allowed_origins: frozenset
+    neptune_endpoint: str
+    neptune_port: str
+    neptune_use_ssl: bool
+    neptune_pool_size: int
+    image_dir: str
+    image_base_url: str
+    argon2_time_cost: int
+    argon2_memory_cost: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            environment=os.getenv("ENVIRONMENT", "production"),
+            debug=_env_bool("DEBUG"),
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            allowed_origins=_env_origins("ALLOWED_ORIGINS", "http://localhost:5173"),
+            neptune_endpoint=os.getenv("NEPTUNE_ENDPOINT", "localhost"),
+            neptune_port=os.getenv("NEPTUNE_PORT", "8182"),
+            neptune_use_ssl=_env_bool("NEPTUNE_USE_SSL"),
+            neptune_pool_size=int(os.getenv("NEPTUNE_POOL_SIZE", "20")),
+            image_dir=os.getenv("IMAGE_DIR", "images"),
+            image_base_url=os.getenv("IMAGE_BASE_URL", "/images").rstrip("/"),
+            argon2_time_cost=int(os.getenv("ARGON2_TIME_COST", "2")),
+            argon2_memory_cost=int(os.getenv("ARGON2_MEMORY_COST", "65536")),
+        )
+
+    @property
+    def is_development(self) -> bool:
+        return self.environment == "development"
+
+    @property
+    def neptune_url(self) -> str:
+        """Websocket URL of the Gremlin endpoint.
+
+        NEPTUNE_ENDPOINT is normally a bare host name, but a full
+        ws://host:port/gremlin URL is accepted as well.
+        """
+        if "://" in self.neptune_endpoint:
+            return self.neptune_endpoint
+        scheme = "wss" if self.neptune_use_ssl else "ws"
+        return f"{scheme}://{self.neptune_endpoint}:{self.neptune_port}/gremlin"
+
+
+settings = Settings.from_env()
@@ -0,0 +1,134 @@
+# backend/app/image_store.py
+# Character images are stored as files and only their URL is kept on the vertex
+
+import base64
+import binascii
+import io
+import logging
+import os
+import re
+from contextlib import contextmanager
+from typing import Iterator
+
+from PIL import Image
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024  # 5MB limit
+
+_DATA_URL_RE = re.compile(r"^data:image/(png|jpeg|jpg|gif|webp);base64,", re.IGNORECASE)
+
+# Every extension decode_image_data can produce, so a character's files can be found without a listdir
+_EXTENSIONS = ("png", "jpg", "gif", "webp")
+
+# Pillow format names of the uploads accepted as files, and their extensions
+_FORMAT_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "GIF": "gif", "WEBP": "webp"}
+
+
+def decode_image_data(image_data: str) -> tuple[str, bytes]:
+    """Split a data:image/...;base64 URL into a file extension and raw bytes."""
+    match = _DATA_URL_RE.match(image_data)
+    if not match:
+        raise ValueError("Image must be a valid data URL")
+
+    try:
+        raw = base64.b64decode(image_data[match.end():], validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid image data provided")
+
+    if len(raw) > MAX_IMAGE_BYTES:
+        raise ValueError("Image file too large (max 5MB)")
+
+    extension = match.group(1).lower()
+    return ("jpg" if extension == "jpeg" else extension), raw
+
+
+def shrink_image(content: bytes, max_size=(800, 800)) -> tuple[str, bytes]:
+    """
+    Resize an encoded image to fit max_size, keeping its format. Returns the
+    file extension for that format and the resulting bytes.
+    """
+    image = Image.open(io.BytesIO(content))
+    extension = _FORMAT_EXTENSIONS.get(image.format)
+    if extension is None:
+        raise ValueError("Unsupported image format")
+    if image.size[0] <= max_size[0] and image.size[1] <= max_size[1]:
+        return extension, content
+
+    image_format = image.format
+    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+    # JPEG has no palette or alpha modes; saving those needs RGB first
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return extension, buffer.getvalue()
+
+
+def _image_path(character_id: str, extension: str) -> str:
+    return os.path.join(settings.image_dir, f"{character_id}.{extension}")
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Error removing image %s: %s", path, e)
+
+
+def stored_character_image(character_id: str, image_data: str):
+    """stored_character_image_bytes for a data:image/...;base64 URL."""
+    if not character_id.isalnum():
+        raise ValueError("Invalid character ID")
+    extension, raw = decode_image_data(image_data)
+    return stored_character_image_bytes(character_id, extension, raw)
+
+
+@contextmanager
+def stored_character_image_bytes(character_id: str, extension: str, raw: bytes) -> Iterator[str]:
+    """
+    Write a character's image and yield its URL for the graph write.
+
+    If the block raises, the new file is removed and any image it replaced is
+    restored, so a failed write leaves no orphan. On success, images stored
+    under other extensions are removed.
+    """
+    if not character_id.isalnum() or extension not in _EXTENSIONS:
+        raise ValueError("Invalid character image")
+    os.makedirs(settings.image_dir, exist_ok=True)
+
+    path = _image_path(character_id, extension)
+    backup = f"{path}.bak"
+    had_previous = os.path.exists(path)
+    if had_previous:
+        os.replace(path, backup)
+
+    try:
+        with open(path, "wb") as f:
+            f.write(raw)
+        yield f"{settings.image_base_url}/{character_id}.{extension}"
+    except BaseException:
+        if had_previous:
+            os.replace(backup, path)
+        else:
+            _remove(path)
+        raise
+
+    if had_previous:
+        _remove(backup)
+    for other in _EXTENSIONS:
+        if other != extension:
+            _remove(_image_path(character_id, other))
+
+
+def delete_character_image(character_id: str) -> None:
+    """Remove any stored image for the character."""
+    if not character_id.isalnum():
+        return
+    for extension in _EXTENSIONS:
+        _remove(_image_path(character_id, extension))
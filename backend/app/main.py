@@ -1,37 +1,124 @@
 # // File: backend / app / main.py
 
+import asyncio
+import logging
+import time
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from fastapi.responses import HTMLResponse
+from fastapi.responses import ORJSONResponse
+from fastapi.staticfiles import StaticFiles
 from app.routers import character, habit, completion, adventure, enemy, auth
-from app.neptune_client import run_query, init_neptune_client, close_neptune_client
-import os
+from app.neptune_client import run_query_async, init_neptune_client, close_neptune_client, warm_neptune_pool
+from app.config import settings
+from app.models.enemy import migrate_legacy_enemy_templates
+from app.models.habit import migrate_legacy_completion_history
+from app.models.character import migrate_legacy_character_images, migrate_legacy_habit_points
+
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Starting up...")
+    logger.info("Starting up...")
     init_neptune_client()
+    await warm_neptune_pool()
+    await asyncio.to_thread(migrate_legacy_enemy_templates)
+    await asyncio.to_thread(migrate_legacy_completion_history)
+    await asyncio.to_thread(migrate_legacy_habit_points)
+    await asyncio.to_thread(migrate_legacy_character_images)
+    # Enemy templates can optionally be seeded here as well:
+    # from app.models.enemy import create_enemy_templates
+    # create_enemy_templates()
+    logger.info("Application started successfully")
     yield
-    print("Shutting down...")
+    logger.info("Shutting down...")
     close_neptune_client()
 
 app = FastAPI(
     title="Habits Adventure API",
     description="A gamified habit tracking system with RPG mechanics",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
-# Get allowed origins from environment
-allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:5173").split(",")
+# Browsers cache preflight responses for this many seconds (24h)
+CORS_MAX_AGE = 86400
+
+
+class OriginOnlyCORSMiddleware:
+    """Run CORSMiddleware only for requests that carry an Origin header.
+
+    Same-origin and server-to-server traffic (health checks, internal
+    callers) never sends Origin, so it goes straight to the app.
+    """
+
+    def __init__(self, app, **cors_options):
+        self.app = app
+        self.cors = CORSMiddleware(app, **cors_options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, _ in scope["headers"]:
+                if name == b"origin":
+                    return await self.cors(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+
+# Adventure requests are a few hundred bytes of JSON; anything much
+# larger is refused before it is read and parsed
+ADVENTURE_MAX_BODY_BYTES = 16 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over max_bytes for paths under path_prefix."""
+
+    def __init__(self, app, path_prefix: str, max_bytes: int):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            return await self.app(scope, receive, send)
+
+        for name, value in scope["headers"]:
+            if name != b"content-length":
+                continue
+            try:
+                declared = int(value or 0)
+            except ValueError:
+                return await ORJSONResponse({"detail": "Invalid Content-Length"}, status_code=400)(scope, receive, send)
+            if declared > self.max_bytes:
+                return await ORJSONResponse({"detail": "Request body too large"}, status_code=413)(scope, receive, send)
+
+        # Bodies sent without a Content-Length are counted as they arrive
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > self.max_bytes:
+                raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        return await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(BodySizeLimitMiddleware, path_prefix="/api/adventure/", max_bytes=ADVENTURE_MAX_BODY_BYTES)
+
 # CORS middleware
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
+    OriginOnlyCORSMiddleware,
+    allow_origins=settings.allowed_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=("GET", "POST", "PUT", "DELETE", "OPTIONS"),
+    allow_headers=("Authorization", "Content-Type"),
+    expose_headers=(),
+    max_age=CORS_MAX_AGE,
 )
 
 # Include all routers
@@ -42,50 +129,73 @@ app.include_router(adventure.router, prefix="/api")
 app.include_router(enemy.router, prefix="/api")
 app.include_router(auth.router, prefix="/api")
 
+# Character images are served from disk unless IMAGE_BASE_URL points at a CDN.
+# This is deliberately public, like a CDN would be: <img> tags cannot send the
+# bearer token, so the file URL itself is the capability. It is built from
+# the character's random 63-bit id and only handed out by the ownership-checked
+# character routes, so it cannot be guessed or enumerated.
+if settings.image_base_url.startswith("/"):
+    app.mount(
+        settings.image_base_url,
+        StaticFiles(directory=settings.image_dir, check_dir=False),
+        name="images",
+    )
+
 @app.get("/")
 def read_root():
     return {"message": "Habits Adventure API", "version": "1.0.0"}
 
 
+# The health probe is hit by load balancers many times per second, so the
+# database check is cached briefly and refreshed by at most one request.
+HEALTH_CACHE_TTL_SECONDS = 5.0
+_health_cache = (0.0, None)
+_health_lock = asyncio.Lock()
+
+
+async def _database_status() -> dict:
+    global _health_cache
+    checked_at, status = _health_cache
+    if status is not None and time.monotonic() - checked_at < HEALTH_CACHE_TTL_SECONDS:
+        return status
+
+    async with _health_lock:
+        # Another request may have refreshed the status while we waited
+        checked_at, status = _health_cache
+        if status is not None and time.monotonic() - checked_at < HEALTH_CACHE_TTL_SECONDS:
+            return status
+
+        try:
+            # Test database connectivity
+            await run_query_async("g.V().limit(1)")
+            status = {
+                "status": "healthy",
+                "database": "connected",
+                "version": "1.0.0"
+            }
+        except Exception as e:
+            status = {
+                "status": "unhealthy",
+                "database": "disconnected",
+                "error": str(e)
+            }
+        _health_cache = (time.monotonic(), status)
+        return status
+
+
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
-    try:
-        # Test database connectivity
-        result = run_query("g.V().limit(1)")
-        return {
-            "status": "healthy",
-            "database": "connected",
-            "version": "1.0.0"
-        }
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "database": "disconnected",
-            "error": str(e)
-        }
+    return await _database_status()
 
 
 # Development endpoints (remove in production)
-if os.getenv("ENVIRONMENT") == "development":
+if settings.is_development:
     @app.get("/debug/info")
     def debug_info():
         return {
-            "allowed_origins": allowed_origins,
-            "environment": os.getenv("ENVIRONMENT", "development"),
-            "neptune_endpoint": os.getenv("NEPTUNE_ENDPOINT", "localhost"),
-            "neptune_port": os.getenv("NEPTUNE_PORT", "8182")
+            "allowed_origins": sorted(settings.allowed_origins),
+            "environment": settings.environment,
+            "neptune_endpoint": settings.neptune_endpoint,
+            "neptune_port": settings.neptune_port
         }
-
-
-# Initialize enemy templates on startup (optional)
-@app.on_event("startup")
-async def startup_event():
-    """Initialize default data on application startup"""
-    try:
-        # You can optionally initialize enemy templates here
-        # from app.models.enemy import create_enemy_templates
-        # create_enemy_templates()
-        print("Application started successfully")
-    except Exception as e:
-        print(f"Startup error: {e}")
\ No newline at end of file
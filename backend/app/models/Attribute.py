@@ -1,4 +1,19 @@
+from typing import Iterable, List
+
+
+def attribute_bonus(base_score: int, habit_points: int = 0) -> int:
+    """Total bonus for one attribute without building an Attribute object."""
+    return (base_score - 10) // 2 + habit_points // 5
+
+
+def total_bonus_batch(base_scores: Iterable[int], habit_points: Iterable[int]) -> List[int]:
+    """Total bonuses for parallel sequences of base scores and habit points."""
+    return [(base - 10) // 2 + points // 5 for base, points in zip(base_scores, habit_points)]
+
+
 class Attribute:
+    __slots__ = ("name", "base_score", "habit_points", "_bonus")
+
     def __init__(self, name: str, base_score: int, habit_points: int = 0):
         # Add validation
         if not isinstance(name, str) or not name.strip():
@@ -9,6 +24,8 @@ class Attribute:
         self.name = name
         self.base_score = base_score
         self.habit_points = int(habit_points)
+        # Scores are not changed after construction, so the bonus is fixed
+        self._bonus = attribute_bonus(self.base_score, self.habit_points)
 
     def calculate_base_bonus(self) -> int:
         """Calculate the bonus from the base score using DnD rules (usually (score - 10) // 2)."""
@@ -21,7 +38,7 @@ class Attribute:
 
     def total_bonus(self) -> int:
         """Total bonus is the sum of base bonus and habit bonus."""
-        return self.calculate_base_bonus() + self.calculate_habit_bonus()
+        return self._bonus
 
     def __str__(self):
         return (f"{self.name}: Score={self.base_score}, "
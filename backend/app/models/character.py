@@ -2,40 +2,260 @@
 
 # TODO Update character.py to remove user-specific filtering from get_all_characters
 # TODO This function should now only be used internally, not exposed via API
-import base64
-import uuid
-from gremlin_python.process.traversal import T
-from app.neptune_client import run_query
-from app.models.Attribute import Attribute
-from pydantic import BaseModel
-
-class CharacterSummary(BaseModel):
-    id: str
-    name: str
-    image_url: str = None # Allow users to add an avatar for their character.
+import hashlib
+import logging
+import re
+import threading
+from functools import lru_cache
+from secrets import randbits
+from typing import Optional
+
+import orjson
+from cachetools import TTLCache
+from app.neptune_client import run_query, run_query_async
+from app.models.Attribute import Attribute, total_bonus_batch
+from app.models.queries import CHARACTER_BY_ID
+from app.image_store import (
+    delete_character_image,
+    stored_character_image,
+    stored_character_image_bytes,
+)
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "ATTRIBUTE_NAMES",
+    "MAX_IMAGE_DATA_LENGTH",
+    "generate_character_id",
+    "create_character",
+    "update_character",
+    "link_habits_with_character",
+    "update_character_image",
+    "update_character_image_bytes",
+    "delete_character",
+    "get_character",
+    "get_character_image",
+    "get_character_etag",
+    "remember_character_etag",
+    "update_character_habit_score",
+    "update_character_hp",
+    "get_character_adventure_status",
+    "apply_adventure_results",
+    "migrate_legacy_habit_points",
+    "migrate_legacy_character_images",
+]
+
+# Gremlin scripts are built once at import. Values are always passed as
+# bindings, so the script text is identical on every call.
+
+_CREATE_CHARACTER_QUERY = (
+    "g.addV('Character')"
+    ".property(T.id, cid)"
+    ".property('character_id', cid)"
+    ".property('name', char_name)"
+    ".property('level', 1)"
+    ".property('current_xp', 0)"
+    ".property('current_hp', current_hp)"
+    ".property('max_hp', max_hp)"
+    ".property('strength', strength)"
+    ".property('strength_habit_points', strength_hp)"
+    ".property('dexterity', dexterity)"
+    ".property('dexterity_habit_points', dexterity_hp)"
+    ".property('constitution', constitution)"
+    ".property('constitution_habit_points', constitution_hp)"
+    ".property('intelligence', intelligence)"
+    ".property('intelligence_habit_points', intelligence_hp)"
+    ".property('wisdom', wisdom)"
+    ".property('wisdom_habit_points', wisdom_hp)"
+    ".property('charisma', charisma)"
+    ".property('charisma_habit_points', charisma_hp)"
+)
+_CREATE_CHARACTER_WITH_IMAGE_QUERY = _CREATE_CHARACTER_QUERY + ".property('image_url', image_url)"
+
+_SET_IMAGE_URL_QUERY = (
+    "g." + CHARACTER_BY_ID +
+    ".sideEffect(properties('image_data').drop())"
+    ".property(single, 'image_url', image_url)"
+)
+
+# Characters created before images moved to files carry the base64 data URL
+# on the vertex. Only data URLs the image store can decode are matched, so
+# anything else is left alone (and still served inline) instead of being
+# fetched again on every startup.
+_LEGACY_IMAGE_PREFIXES = ", ".join(
+    f"has('image_data', startingWith('data:image/{extension};base64,'))"
+    for extension in ("png", "jpeg", "jpg", "gif", "webp")
+)
+
+_LEGACY_IMAGE_IDS_QUERY = (
+    "g.V().hasLabel('Character').or(" + _LEGACY_IMAGE_PREFIXES + ").values('character_id')"
+)
+
+_LEGACY_IMAGE_DATA_QUERY = "g." + CHARACTER_BY_ID + ".values('image_data')"
+
+_DELETE_CHARACTER_QUERY = "g." + CHARACTER_BY_ID + ".drop()"
+
+_GET_CHARACTER_QUERY = "g." + CHARACTER_BY_ID + ".elementMap()"
+
+_GET_CHARACTER_IMAGE_QUERY = (
+    "g." + CHARACTER_BY_ID + ".coalesce(values('image_url'), values('image_data'))"
+)
+
+# Read, add and write back server side so a habit tick is one round trip.
+# The total is stored as an int so reads need no conversion.
+_ADD_HABIT_POINTS_QUERY = (
+    "g.withSack(0)." + CHARACTER_BY_ID +
+    ".sack(assign).by(coalesce(values(key), constant(0)))"
+    ".sack(sum).by(constant(inc))"
+    ".property(single, key, sack())"
+    ".values(key)"
+)
+
+# Read the HP pair, clamp current_hp + hp_change to [0, max_hp] and write it
+# back, all in one traversal. The last by() runs after the first two have
+# captured the previous values.
+_UPDATE_HP_QUERY = (
+    "g.withSack(0)." + CHARACTER_BY_ID +
+    ".project('previous_hp', 'max_hp', 'current_hp')"
+    ".by(coalesce(values('current_hp'), constant(0)))"
+    ".by(coalesce(values('max_hp'), constant(20)))"
+    ".by(sack(assign).by(coalesce(values('current_hp'), constant(0)))"
+    ".sack(sum).by(constant(hp_change))"
+    ".sack(min).by(coalesce(values('max_hp'), constant(20)))"
+    ".sack(max).by(constant(0))"
+    ".property(single, 'current_hp', sack())"
+    ".sack())"
+)
+
+# Everything the adventure status screen shows, inventory_* counters
+# included, in a single read
+_ADVENTURE_STATUS_QUERY = (
+    "g." + CHARACTER_BY_ID +
+    ".project('character', 'inventory')"
+    ".by(elementMap('name', 'level', 'current_hp', 'max_hp', 'current_xp'))"
+    ".by(properties().hasKey(startingWith('inventory_')).group().by(key()).by(value()))"
+)
+
+# An adventure's HP, XP, level and loot are written in one traversal. The
+# first four by() steps capture the previous values; each later step reads
+# what the one before it wrote. HP is clamped to [0, max_hp]. Each level
+# costs 100 XP, so the new level is max(level, current_xp / 100 + 1) with
+# integer division. Loot adds to inventory_<type> counters, bindings
+# suffixed _<index>.
+XP_PER_LEVEL = 100
+
+
+@lru_cache(maxsize=32)
+def _apply_adventure_script(loot_count: int) -> str:
+    """One traversal applying an adventure's results, with `loot_count` item types"""
+    columns = [
+        "'previous_hp'", "'max_hp'", "'previous_xp'", "'previous_level'",
+        "'current_hp'", "'current_xp'", "'current_level'",
+    ]
+    steps = [
+        ".by(coalesce(values('current_hp'), constant(0)))",
+        ".by(coalesce(values('max_hp'), constant(20)))",
+        ".by(coalesce(values('current_xp'), constant(0)))",
+        ".by(coalesce(values('level'), constant(1)))",
+        ".by(sack(assign).by(coalesce(values('current_hp'), constant(0)))"
+        ".sack(sum).by(constant(hp_change))"
+        ".sack(min).by(coalesce(values('max_hp'), constant(20)))"
+        ".sack(max).by(constant(0))"
+        ".property(single, 'current_hp', sack())"
+        ".sack())",
+        ".by(sack(assign).by(coalesce(values('current_xp'), constant(0)))"
+        ".sack(sum).by(constant(xp_gained))"
+        ".property(single, 'current_xp', sack())"
+        ".sack())",
+        ".by(sack(assign).by(values('current_xp'))"
+        ".sack(div).by(constant(xp_per_level))"
+        ".sack(sum).by(constant(1))"
+        ".sack(max).by(coalesce(values('level'), constant(1)))"
+        ".property(single, 'level', sack())"
+        ".sack())",
+    ]
+    if loot_count:
+        columns.append("'inventory'")
+        loot = "".join(
+            f".sack(assign).by(coalesce(values(key_{i}), constant(0)))"
+            f".sack(sum).by(constant(qty_{i}))"
+            f".property(single, key_{i}, sack())"
+            for i in range(loot_count)
+        )
+        keys = ", ".join(f"key_{i}" for i in range(loot_count))
+        steps.append(f".by({loot[1:]}.properties({keys}).group().by(key()).by(value()))")
+    return (
+        "g.withSack(0)." + CHARACTER_BY_ID +
+        ".project(" + ", ".join(columns) + ")" + "".join(steps)
+    )
+
+
+# The attributes we care about, paired with their habit point property keys
+ATTRIBUTE_NAMES = ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma")
+_ATTRIBUTE_KEYS = tuple((attr, f"{attr}_habit_points") for attr in ATTRIBUTE_NAMES)
+
+# Habit point totals used to be stored as strings, which sack(sum) cannot
+# add to, and written without single cardinality, which left several values
+# per key. This finds only the characters that still hold such a total (the
+# text predicate matches string values alone), so once they are migrated the
+# startup check returns nothing.
+_LEGACY_POINTS_FILTERS = ", ".join(
+    f"has('{key}', startingWith('')), properties('{key}').count().is(gt(1))"
+    for _, key in _ATTRIBUTE_KEYS
+)
+
+_HABIT_POINTS_QUERY = (
+    "g.V().hasLabel('Character')"
+    ".or(" + _LEGACY_POINTS_FILTERS + ")"
+    ".project('character_id', 'points')"
+    ".by(values('character_id'))"
+    ".by(valueMap(" + ", ".join(f"'{key}'" for _, key in _ATTRIBUTE_KEYS) + "))"
+)
+
+
+@lru_cache(maxsize=len(ATTRIBUTE_NAMES))
+def _set_habit_points_script(count: int) -> str:
+    """Write `count` habit point totals, bindings key_<index>/value_<index>."""
+    steps = "".join(f".property(single, key_{i}, value_{i})" for i in range(count))
+    return "g." + CHARACTER_BY_ID + steps + ".id()"
+
+
+MAX_IMAGE_DATA_LENGTH = 5_242_880  # 5MB limit
+
+# Character ids are decimal strings of a 63-bit random integer
+_CHARACTER_ID_RE = re.compile(r"\A[0-9]{1,19}\Z")
+
+
+# ETags of the last get_character response per character_id. Every write in
+# this module drops the entry; the TTL bounds how long a write made by another
+# worker, or directly in Neptune, can keep answering 304 with a stale tag.
+CHARACTER_ETAG_TTL_SECONDS = 30
+_character_etags = TTLCache(maxsize=10_000, ttl=CHARACTER_ETAG_TTL_SECONDS)
+_character_etags_lock = threading.Lock()
+
+
+def get_character_etag(character_id: str) -> Optional[str]:
+    """Return the ETag of the character's current representation, if known."""
+    with _character_etags_lock:
+        return _character_etags.get(character_id)
+
+
+def remember_character_etag(character_id: str, payload: dict) -> str:
+    """Compute and cache the ETag for a serialized character payload."""
+    etag = '"' + hashlib.blake2b(orjson.dumps(payload), digest_size=16).hexdigest() + '"'
+    with _character_etags_lock:
+        _character_etags[character_id] = etag
+    return etag
+
+
+def _invalidate_character_etag(character_id: str) -> None:
+    with _character_etags_lock:
+        _character_etags.pop(character_id, None)
+
 
 def generate_character_id() -> str:
     """Generate a unique character ID that fits within a 64-bit integer."""
-    return str(uuid.uuid4().int % (2**63))
-
-def list_characters() -> list[CharacterSummary]:
-    # Use custom character_id property instead of T.id
-    query = (
-        "g.V().hasLabel('Character')"
-        ".project('character_id','name')"
-        ".by('character_id').by('name')"
-    )
-    results = run_query(query)
-    summaries = []
-    for row in results:
-        summaries.append(
-            CharacterSummary(
-                id=str(row['character_id']),  # FIXED: Use 'character_id' key
-                name=row['name']
-            )
-        )
-    return summaries
-
+    return str(randbits(63))
 
 def create_character(name: str, strength: int, dexterity: int, constitution: int,
                      intelligence: int, wisdom: int, charisma: int, image_data: str = None):
@@ -43,11 +263,12 @@ def create_character(name: str, strength: int, dexterity: int, constitution: int
     if not name or not name.strip():
         raise ValueError("Character name cannot be empty")
 
-    for attr_name, value in [("strength", strength), ("dexterity", dexterity),
-                             ("constitution", constitution), ("intelligence", intelligence),
-                             ("wisdom", wisdom), ("charisma", charisma)]:
-        if not isinstance(value, int) or value < 1 or value > 30:
-            raise ValueError(f"{attr_name} must be between 1 and 30")
+    scores = (strength, dexterity, constitution, intelligence, wisdom, charisma)
+    if not all(type(score) is int and 1 <= score <= 30 for score in scores):
+        # Only work out which attribute failed once we know one did
+        attr_name = next(attr for attr, score in zip(ATTRIBUTE_NAMES, scores)
+                         if not (type(score) is int and 1 <= score <= 30))
+        raise ValueError(f"{attr_name} must be between 1 and 30")
 
     # Validate image data if provided
     if image_data:
@@ -56,7 +277,7 @@ def create_character(name: str, strength: int, dexterity: int, constitution: int
             if not image_data.startswith('data:image/'):
                 raise ValueError("Image must be a valid data URL")
             # You can add size limits here if needed
-            if len(image_data) > 5 * 1024 * 1024:  # 5MB limit
+            if len(image_data) > MAX_IMAGE_DATA_LENGTH:
                 raise ValueError("Image file too large (max 5MB)")
         except Exception as e:
             raise ValueError("Invalid image data provided")
@@ -77,46 +298,49 @@ def create_character(name: str, strength: int, dexterity: int, constitution: int
         max_hp = 10 + constitution_attr.calculate_base_bonus()
         current_hp = max_hp
 
-        # Build the Gremlin query to create the character vertex
-        query = (
-            f"g.addV('Character')"
-            f".property('character_id', '{character_id}')"
-            f".property('name', '{name}')"
-            f".property('level', 1)"
-            f".property('current_xp', 0)"
-            f".property('current_hp', {current_hp})"
-            f".property('max_hp', {max_hp})"
-            f".property('strength', {strength_attr.base_score})"
-            f".property('strength_habit_points', {strength_attr.habit_points})"
-            f".property('dexterity', {dexterity_attr.base_score})"
-            f".property('dexterity_habit_points', {dexterity_attr.habit_points})"
-            f".property('constitution', {constitution_attr.base_score})"
-            f".property('constitution_habit_points', {constitution_attr.habit_points})"
-            f".property('intelligence', {intelligence_attr.base_score})"
-            f".property('intelligence_habit_points', {intelligence_attr.habit_points})"
-            f".property('wisdom', {wisdom_attr.base_score})"
-            f".property('wisdom_habit_points', {wisdom_attr.habit_points})"
-            f".property('charisma', {charisma_attr.base_score})"
-            f".property('charisma_habit_points', {charisma_attr.habit_points})"
-        )
+        # Values are sent as bindings, so names need no escaping
+        bindings = {
+            "cid": character_id,
+            "char_name": name,
+            "current_hp": current_hp,
+            "max_hp": max_hp,
+        }
+        for attr in (strength_attr, dexterity_attr, constitution_attr,
+                     intelligence_attr, wisdom_attr, charisma_attr):
+            bindings[attr.name] = attr.base_score
+            bindings[f"{attr.name}_hp"] = attr.habit_points
 
         if image_data:
-            # Escape single quotes in base64 data
-            escaped_image_data = image_data.replace("'", "\\'")
-            query += f".property('image_data', '{escaped_image_data}')"
-
-        result = run_query(query)
-        if not result:
-            raise RuntimeError("Failed to create Character vertex")
+            # Only the URL goes on the vertex; the bytes are kept in the image store,
+            # which removes the file again if the vertex write fails
+            with stored_character_image(character_id, image_data) as image_url:
+                bindings["image_url"] = image_url
+                _create_character_vertex(_CREATE_CHARACTER_WITH_IMAGE_QUERY, bindings)
+        else:
+            _create_character_vertex(_CREATE_CHARACTER_QUERY, bindings)
 
         # Return just the character_id string
         return character_id
 
     except Exception as e:
-        print(f"Error creating Character: {e}")
+        logger.exception("Error creating Character")
         raise e
 
 
+def _create_character_vertex(query: str, bindings: dict) -> None:
+    result = run_query(query, bindings)
+    if not result:
+        raise RuntimeError("Failed to create Character vertex")
+
+
+def _set_image_url(character_id: str, stored_image) -> str:
+    """Store the image and point the vertex at it, undoing the file write on failure."""
+    with stored_image as image_url:
+        run_query(_SET_IMAGE_URL_QUERY, {"cid": character_id, "image_url": image_url})
+    _invalidate_character_etag(character_id)
+    return image_url
+
+
 def update_character(character_id: str, image_data: str = None) -> bool:
     """
     Update a character's image data
@@ -128,17 +352,12 @@ def update_character(character_id: str, image_data: str = None) -> bool:
                 raise ValueError("Invalid image data format")
 
             # Update the character's image
-            query = (
-                f"g.V().hasLabel('Character')"
-                f".has('character_id', '{character_id}')"
-                f".property('image_data', '{image_data}')"
-            )
-            run_query(query)
+            _set_image_url(character_id, stored_character_image(character_id, image_data))
 
         return True
 
     except Exception as e:
-        print(f"Error updating character {character_id}: {e}")
+        logger.exception("Error updating character %s", character_id)
         return False
 
 
@@ -152,12 +371,12 @@ def link_habits_with_character(character_id: str):
         # are created with character_id already
         pass
     except Exception as e:
-        print(f"Error linking habits with character: {e}")
+        logger.exception("Error linking habits with character")
 
 
 def update_character_image(character_id: str, image_data: str):
     """Update character image"""
-    if not character_id or not character_id.strip():
+    if not isinstance(character_id, str) or not _CHARACTER_ID_RE.match(character_id):
         raise ValueError("Invalid character ID")
 
     if not image_data:
@@ -167,22 +386,29 @@ def update_character_image(character_id: str, image_data: str):
     if not image_data.startswith('data:image/'):
         raise ValueError("Image must be a valid data URL")
 
-    if len(image_data) > 5 * 1024 * 1024:  # 5MB limit
+    if len(image_data) > MAX_IMAGE_DATA_LENGTH:
         raise ValueError("Image file too large (max 5MB)")
 
-    try:
-        # Escape single quotes in base64 data
-        escaped_image_data = image_data.replace("'", "\\'")
+    return _update_image(character_id, stored_character_image(character_id, image_data))
 
-        query = (
-            f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-            f".property('image_data', '{escaped_image_data}')"
-        )
 
-        result = run_query(query)
-        return {"status": "success", "message": "Image updated successfully"}
+def update_character_image_bytes(character_id: str, extension: str, content: bytes):
+    """Update character image from the raw bytes of an uploaded file"""
+    if not isinstance(character_id, str) or not _CHARACTER_ID_RE.match(character_id):
+        raise ValueError("Invalid character ID")
+
+    if len(content) > MAX_IMAGE_DATA_LENGTH:
+        raise ValueError("Image file too large (max 5MB)")
+
+    return _update_image(character_id, stored_character_image_bytes(character_id, extension, content))
+
+
+def _update_image(character_id: str, stored_image) -> dict:
+    try:
+        image_url = _set_image_url(character_id, stored_image)
+        return {"status": "success", "message": "Image updated successfully", "image_url": image_url}
     except Exception as e:
-        print(f"Error updating character image: {e}")
+        logger.exception("Error updating character image")
         raise RuntimeError(f"Failed to update character image: {str(e)}")
 
 def delete_character(character_id: str):
@@ -190,132 +416,181 @@ def delete_character(character_id: str):
     Delete a character vertex from the graph database using its ID.
     """
     # Query by custom property
-    query = f"g.V().hasLabel('Character').has('character_id', '{character_id}').drop()"
-    run_query(query)
+    run_query(_DELETE_CHARACTER_QUERY, {"cid": character_id})
+    delete_character_image(character_id)
+    _invalidate_character_etag(character_id)
     return {"status": "success", "message": f"Character {character_id} deleted."}
 
-def get_character(character_id: str):
-    if not character_id or not character_id.strip():
+
+def _build_attributes(char_data: dict) -> dict:
+    """Base score, habit points and bonus for every attribute on the vertex."""
+    # elementMap() returns plain scalar values, so nothing needs unwrapping
+    names, bases, habits = [], [], []
+    for attr, habit_key in _ATTRIBUTE_KEYS:
+        base_val = char_data.get(attr)
+        if base_val is None:
+            continue
+        names.append(attr)
+        bases.append(base_val)
+        habits.append(int(char_data.get(habit_key) or 0))
+
+    # Values come straight from the vertex, so compute all bonuses in one
+    # pass instead of building a validated Attribute instance per attribute.
+    bonuses = total_bonus_batch(bases, habits)
+    return {
+        attr: {"base": base_val, "habit_points": habit_val, "bonus": bonus}
+        for attr, base_val, habit_val, bonus in zip(names, bases, habits, bonuses)
+    }
+
+
+async def get_character(character_id: str):
+    if not isinstance(character_id, str) or not _CHARACTER_ID_RE.match(character_id):
         raise ValueError("Invalid character ID")
 
     try:
-        # Build a Gremlin query to fetch the character's properties.
-        query = f"g.V().hasLabel('Character').has('character_id', '{character_id}').elementMap()"
-        result = run_query(query)
+        # Fetch the character's properties.
+        result = await run_query_async(_GET_CHARACTER_QUERY, {"cid": character_id})
         if not result:
             return None
 
         # Assume result[0] is a dictionary of properties.
         char_data = result[0]
     except Exception as e:
-        print(f"Error fetching character {character_id}: {e}")
+        logger.exception("Error fetching character %s", character_id)
         raise
 
-    # Sometimes the properties returned by valueMap(true) are lists.
-    def extract_value(value):
-        return value[0] if isinstance(value, list) else value
+    return _character_from_row(char_data)
+
+
+def get_character_image(character_id: str) -> Optional[str]:
+    """Image URL of a character, or its legacy inline image data."""
+    try:
+        result = run_query(_GET_CHARACTER_IMAGE_QUERY, {"cid": character_id})
+        return result[0] if result else None
+    except Exception:
+        logger.exception("Error fetching image of character %s", character_id)
+        return None
+
 
+def _character_from_row(char_data: dict) -> dict:
+    """Turn a Character elementMap row into the API representation."""
     # FIXED: Look for character_id in the data (not 'id')
-    char_id = extract_value(char_data.get("character_id"))
-    name = extract_value(char_data.get("name"))
-    image_data = extract_value(char_data.get("image_data"))
-
-    # List the attributes we care about.
-    attribute_names = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
-    attributes = {}
-    for attr in attribute_names:
-        base_val = extract_value(char_data.get(attr))
-        habit_val = extract_value(char_data.get(f"{attr}_habit_points")) or 0
-        if base_val is None:
-            continue
+    char_id = char_data.get("character_id")
+    name = char_data.get("name")
+    image_url = char_data.get("image_url")
+    # Older characters still carry the base64 data URL on the vertex
+    image_data = char_data.get("image_data") or image_url
 
-        # Create an Attribute instance and compute the bonus.
-        attribute_obj = Attribute(attr, base_score=base_val, habit_points=habit_val)
-        attributes[attr] = {
-            "base": base_val,
-            "habit_points": habit_val,
-            "bonus": attribute_obj.total_bonus()
-        }
+    attributes = _build_attributes(char_data)
 
     # Build and return the complete character data.
     return {
         "id": char_id,
         "name": name,
         "image_data": image_data,
+        "image_url": image_url,
         "attributes": attributes,
         # Include additional character properties as needed.
     }
 
-def update_character_habit_score(character_id: str, attribute: str, habit_points_increase_value: int):
+async def update_character_habit_score(character_id: str, attribute: str, habit_points_increase_value: int):
     """
     Update the habit points for the given attribute of a character.
     The habit_points_increase_value should be an integer meeting the reward value
-    This function builds a Gremlin query that updates the habit points property
-    for the specified attribute and returns the result.
+    This function adds the increase to the stored habit points in a single
+    traversal (a missing property counts as 0) and returns the new total.
     """
 
     # Normalize the attribute name to lowercase
     attr_lower_case = attribute.lower()
     property_key = f"{attr_lower_case}_habit_points"
 
-    # FIXED: Use custom property lookup instead of T.id
-    get_query = f"g.V().hasLabel('Character').has('character_id', '{character_id}').values('{property_key}')"
-    current_values = run_query(get_query)
-
-    if current_values and len(current_values) > 0:
-        try:
-            current_value = int(current_values[0])
-        except Exception as e:
-            print(f"Error converting current habit points to int: {e}")
-            current_value = 0
-    else:
-        current_value = 0 # If not found, assume 0 habit points.
-
-    #Calculate the new total habit points.
-    updated_total = current_value + habit_points_increase_value
-
-    # FIXED: Use custom property lookup for update
-    query_update = (
-        f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-        f".property('{property_key}', '{updated_total}')"
-    )
-
-    result = run_query(query_update)
+    result = await run_query_async(_ADD_HABIT_POINTS_QUERY, {
+        "cid": character_id,
+        "key": property_key,
+        "inc": int(habit_points_increase_value),
+    })
+    _invalidate_character_etag(character_id)
     return result
 
 
-def update_character_hp(character_id: str, hp_change: int) -> dict:
+def migrate_legacy_habit_points() -> int:
+    """
+    Rewrite habit point totals stored as strings, or as several values, as
+    one int each, so the server-side addition in update_character_habit_score
+    works on them. Totals that do not parse count as 0, as they did when
+    read; of several values the highest is kept, since totals only grow.
+    Returns the number of characters migrated.
+    """
+    migrated = 0
+    try:
+        for row in run_query(_HABIT_POINTS_QUERY):
+            bindings = {"cid": row["character_id"]}
+            count = 0
+            for key, values in row["points"].items():
+                if len(values) == 1 and not isinstance(values[0], str):
+                    continue
+                totals = []
+                for value in values:
+                    try:
+                        totals.append(int(value))
+                    except ValueError:
+                        logger.warning("Resetting unparseable %s on character %s", key, row["character_id"])
+                total = max(totals, default=0)
+                bindings[f"key_{count}"] = key
+                bindings[f"value_{count}"] = total
+                count += 1
+            if count and run_query(_set_habit_points_script(count), bindings):
+                _invalidate_character_etag(row["character_id"])
+                migrated += 1
+    except Exception:
+        logger.exception("Error migrating legacy habit points")
+
+    if migrated:
+        logger.info("Migrated habit points of %s characters", migrated)
+    return migrated
+
+
+def migrate_legacy_character_images() -> int:
+    """
+    Move inline image_data blobs into the image store and point the vertex at
+    the file instead. Blobs are fetched one character at a time, since each
+    can be several megabytes. Returns the number of characters migrated.
+    """
+    migrated = 0
+    try:
+        for character_id in run_query(_LEGACY_IMAGE_IDS_QUERY):
+            result = run_query(_LEGACY_IMAGE_DATA_QUERY, {"cid": character_id})
+            if not result:
+                continue
+            try:
+                _set_image_url(character_id, stored_character_image(character_id, result[0]))
+            except ValueError as e:
+                logger.warning("Leaving inline image of character %s: %s", character_id, e)
+                continue
+            migrated += 1
+    except Exception:
+        logger.exception("Error migrating legacy character images")
+
+    if migrated:
+        logger.info("Moved images of %s characters to the image store", migrated)
+    return migrated
+
+
+async def update_character_hp(character_id: str, hp_change: int) -> dict:
     """
     Update character's HP by a given amount
     """
     try:
-        # Import here to avoid circular imports
-        from app.neptune_client import run_query
-
-        # Get current HP and max HP
-        get_query = (
-            f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-            f".project('current_hp', 'max_hp')"
-            f".by(coalesce(values('current_hp'), constant(0)))"
-            f".by(coalesce(values('max_hp'), constant(20)))"
-        )
-        result = run_query(get_query)
+        result = await run_query_async(_UPDATE_HP_QUERY, {"cid": character_id, "hp_change": int(hp_change)})
+        _invalidate_character_etag(character_id)
 
         if not result:
             raise ValueError("Character not found")
 
-        current_hp = result[0].get('current_hp', 0)
+        current_hp = result[0].get('previous_hp', 0)
         max_hp = result[0].get('max_hp', 20)
-
-        # Calculate new HP (can't go below 0 or above max)
-        new_hp = max(0, min(max_hp, current_hp + hp_change))
-
-        # Update in database
-        update_query = (
-            f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-            f".property('current_hp', {new_hp})"
-        )
-        run_query(update_query)
+        new_hp = result[0].get('current_hp', current_hp)
 
         return {
             "character_id": character_id,
@@ -327,5 +602,59 @@ def update_character_hp(character_id: str, hp_change: int) -> dict:
         }
 
     except Exception as e:
-        print(f"Error updating character HP: {e}")
-        raise e
\ No newline at end of file
+        logger.exception("Error updating character HP")
+        raise e
+
+
+async def get_character_adventure_status(character_id: str) -> Optional[dict]:
+    """
+    Return {"character": {...}, "inventory": {item_type: quantity}} for the
+    adventure screen, or None if the character does not exist
+    """
+    result = await run_query_async(_ADVENTURE_STATUS_QUERY, {"cid": character_id})
+    if not result:
+        return None
+    inventory = {
+        key.removeprefix('inventory_'): quantity
+        for key, quantity in result[0]['inventory'].items()
+    }
+    return {"character": result[0]['character'], "inventory": inventory}
+
+
+async def apply_adventure_results(character_id: str, hp_change: int, xp_gained: int, loot_items: list) -> Optional[dict]:
+    """
+    Apply an adventure's HP change, XP gain and loot (items with .type and
+    .quantity, such as the adventure router's LootItem) to a character in a
+    single round trip, and return the previous and new values, or None if
+    the character does not exist
+    """
+    try:
+        added = {}
+        for item in loot_items:
+            added[item.type] = added.get(item.type, 0) + item.quantity
+
+        bindings = {
+            "cid": character_id,
+            "hp_change": int(hp_change),
+            "xp_gained": int(xp_gained),
+            "xp_per_level": XP_PER_LEVEL,
+        }
+        for i, (item_type, quantity) in enumerate(added.items()):
+            bindings[f"key_{i}"] = f"inventory_{item_type}"
+            bindings[f"qty_{i}"] = int(quantity)
+        result = await run_query_async(_apply_adventure_script(len(added)), bindings)
+        _invalidate_character_etag(character_id)
+
+        if not result:
+            return None
+
+        row = result[0]
+        inventory = {
+            key.removeprefix('inventory_'): quantity
+            for key, quantity in row.pop('inventory', {}).items()
+        }
+        return {"character_id": character_id, **row, "inventory": inventory}
+
+    except Exception as e:
+        logger.exception("Error applying adventure results")
+        raise e
@@ -1,8 +1,25 @@
-import datetime
-import json
-import uuid
-from gremlin_python.process.traversal import T
+from secrets import randbits
 from app.neptune_client import run_query
+from app.models.queries import HABIT_BY_ID
+
+# Built once at import; values are passed as bindings on every call.
+# Starts from the habit, since the fold() in its lookup would drop a step
+# label set before it; no completion is created for a missing habit.
+_CREATE_COMPLETION_QUERY = (
+    "g." + HABIT_BY_ID +
+    ".addE('hasCompletion').to(addV('HabitCompletion')"
+    ".property(id, completion_id)"
+    ".property('completion_date', completion_date)"
+    ".property('completed', completed))"
+    ".iterate()"
+)
+
+_GET_COMPLETION_QUERY = "g.V(completion_id).elementMap()"
+
+_HABIT_COMPLETIONS_QUERY = (
+    "g." + HABIT_BY_ID +
+    ".outE('hasCompletion').inV().elementMap()"
+)
 
 
 def create_completion(habit_id: str, completion_date: str, completed: bool = True):
@@ -11,32 +28,21 @@ def create_completion(habit_id: str, completion_date: str, completed: bool = Tru
     All IDs are treated as strings.
     """
     # Generate a unique completion_id as a string.
-    completion_id = str(uuid.uuid4().int % (2 ** 63))
-
-    # Build the Gremlin query.
-    # Note: Wrap string values in quotes.
-    query = (
-        f"g.addV('HabitCompletion')"
-        f".property(id, '{completion_id}')"
-        f".property('completion_date', '{completion_date}')"
-        f".property('completed', {str(completed).lower()})"
-        f".as('completion')"
-        f".V().hasLabel('Habit').has('habit_id', '{habit_id}')"
-        f".addE('hasCompletion').to('completion')"
-        f".iterate()"
-    )
-
-    result = run_query(query)
+    completion_id = str(randbits(63))
+
+    result = run_query(_CREATE_COMPLETION_QUERY, {
+        "completion_id": completion_id,
+        "completion_date": completion_date,
+        "completed": bool(completed),
+        "hid": habit_id,
+    })
     return {"completion_id": completion_id, "result": result}
 
 def get_completions_for_habit(habit_id: str):
     """
     Retrieve all completion vertices associated with a habit.
     """
-    query = (
-        f"g.V('{habit_id}').outE('hasCompletion').inV().elementMap(true)"
-    )
-    result = run_query(query)
+    result = run_query(_HABIT_COMPLETIONS_QUERY, {"hid": habit_id})
     # Depending on how your Gremlin server returns results, you might need to process them.
     return result
 
@@ -46,9 +52,5 @@ def get_completion(completion_id: str):
     :param completion_id:
     :return: completion data
     """
-    query = (
-        f"g.V('{completion_id}').elementMap()"
-    )
-
-    result = run_query(query)
+    result = run_query(_GET_COMPLETION_QUERY, {"completion_id": completion_id})
     return result
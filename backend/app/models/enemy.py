@@ -2,10 +2,145 @@
 # Enemy management and database operations
 
 import json
+import logging
+import threading
 import uuid
-from app.neptune_client import run_query
+from functools import lru_cache, wraps
+from cachetools import TTLCache
+from cachetools.keys import hashkey
+from app.neptune_client import run_query, iter_query
 from typing import List, Dict, Optional
 
+logger = logging.getLogger(__name__)
+
+# Single valued properties of an EnemyTemplate vertex, in write order
+_SCALAR_FIELDS = ("enemy_id", "name", "level", "max_hp", "dice_pool", "xp_reward",
+                  "description", "difficulty")
+
+# List fields are stored as set-cardinality multi-properties, one value per
+# element, so they can be filtered with has() inside the graph
+_LIST_FIELDS = ("loot_table", "environment")
+
+# elementMap() keeps only one value per key, so templates are read with
+# valueMap(true), which returns every value of a multi-property
+_TEMPLATE_MAP = ".valueMap(true)"
+
+
+def _add_template_step(enemy_data: Dict, index: int) -> tuple[str, Dict]:
+    """addV step for one template and its bindings, named <field>_<index>[_<n>]."""
+    parts = [f"addV('EnemyTemplate').property(T.id, enemy_id_{index})"]
+    bindings = {}
+    for field in _SCALAR_FIELDS:
+        name = f"{field}_{index}"
+        parts.append(f".property('{field}', {name})")
+        bindings[name] = enemy_data[field]
+    for field in _LIST_FIELDS:
+        for n, value in enumerate(enemy_data.get(field) or []):
+            name = f"{field}_{index}_{n}"
+            parts.append(f".property(set, '{field}', {name})")
+            bindings[name] = value
+    return "".join(parts), bindings
+
+
+# Gremlin scripts are built once at import; values always travel as bindings.
+
+# Templates use their enemy_id as the vertex id, so lookups hit the id index;
+# older templates without it are still found through the enemy_id property
+_TEMPLATE_BY_ID = (
+    "V(eid).hasLabel('EnemyTemplate').fold()"
+    ".coalesce(unfold(), V().hasLabel('EnemyTemplate').has('enemy_id', eid))"
+)
+
+_ALL_ENEMY_TEMPLATES_QUERY = "g.V().hasLabel('EnemyTemplate')" + _TEMPLATE_MAP
+
+_GET_ENEMY_TEMPLATE_QUERY = "g." + _TEMPLATE_BY_ID + _TEMPLATE_MAP
+
+_ENEMIES_BY_DIFFICULTY_QUERY = "g.V().hasLabel('EnemyTemplate').has('difficulty', difficulty)" + _TEMPLATE_MAP
+
+# Exact match against any one of the template's environment values
+_ENEMIES_BY_ENVIRONMENT_QUERY = "g.V().hasLabel('EnemyTemplate').has('environment', environment)" + _TEMPLATE_MAP
+
+# Templates written before list fields became multi-properties hold a
+# single JSON encoded string instead
+_LEGACY_TEMPLATES_QUERY = (
+    "g.V().hasLabel('EnemyTemplate')"
+    ".or(has('loot_table', startingWith('[')), has('environment', startingWith('[')))"
+    + _TEMPLATE_MAP
+)
+
+_DELETE_ENEMY_TEMPLATE_QUERY = "g." + _TEMPLATE_BY_ID + ".drop()"
+
+# Templates only change through the write functions in this module, so reads
+# are served from memory and every write clears the cache. The TTL bounds
+# staleness when another worker process edits templates.
+_template_cache = TTLCache(maxsize=256, ttl=300)
+_template_cache_lock = threading.RLock()
+
+
+def _copy_template(template: Dict) -> Dict:
+    """Copy of a template whose list fields can be changed without touching the cache"""
+    copy = dict(template)
+    for field in _LIST_FIELDS:
+        if isinstance(copy.get(field), list):
+            copy[field] = list(copy[field])
+    return copy
+
+
+def _cached_read(name: str):
+    """
+    Serve a loader's results from the template cache. Callers get copies,
+    so changing one cannot corrupt the cache, and None (no such template)
+    is not cached.
+    """
+    def decorator(load):
+        @wraps(load)
+        def wrapper(*args):
+            key = hashkey(name, *args)
+            with _template_cache_lock:
+                value = _template_cache.get(key)
+            if value is None:
+                value = load(*args)
+                if value is None:
+                    return None
+                with _template_cache_lock:
+                    _template_cache[key] = value
+            if isinstance(value, list):
+                return [_copy_template(template) for template in value]
+            return _copy_template(value)
+        return wrapper
+    return decorator
+
+
+def clear_enemy_template_cache():
+    with _template_cache_lock:
+        _template_cache.clear()
+
+
+@_cached_read("all")
+def _load_all_enemy_templates() -> List[Dict]:
+    # Parse rows as they stream in rather than buffering the raw result first
+    return [parse_enemy_template(template) for template in iter_query(_ALL_ENEMY_TEMPLATES_QUERY)]
+
+
+@_cached_read("template")
+def _load_enemy_template(enemy_id: str) -> Optional[Dict]:
+    result = run_query(_GET_ENEMY_TEMPLATE_QUERY, {"eid": enemy_id})
+    if result:
+        return parse_enemy_template(result[0])
+    return None
+
+
+@_cached_read("difficulty")
+def _load_enemies_by_difficulty(difficulty: str) -> List[Dict]:
+    result = run_query(_ENEMIES_BY_DIFFICULTY_QUERY, {"difficulty": difficulty})
+    return [parse_enemy_template(template) for template in result]
+
+
+@_cached_read("environment")
+def _load_enemies_by_environment(environment: str) -> List[Dict]:
+    result = run_query(_ENEMIES_BY_ENVIRONMENT_QUERY, {"environment": environment})
+    return [parse_enemy_template(template) for template in result]
+
 
 def create_enemy_templates():
     """
@@ -99,13 +234,29 @@ def create_enemy_templates():
         }
     ]
 
-    created_enemies = []
-    for template in enemy_templates:
-        result = create_enemy_template(template)
-        if result:
-            created_enemies.append(result)
+    # Seed every template in one traversal instead of a round trip each
+    steps = []
+    bindings = {}
+    labels = []
+    for i, template in enumerate(enemy_templates):
+        step, step_bindings = _add_template_step(template, i)
+        steps.append(f"{step}.as('t{i}')")
+        bindings.update(step_bindings)
+        labels.append(f"'t{i}'")
+
+    query = (
+        "g." + ".".join(steps)
+        + f".select({', '.join(labels)}).select(values).unfold(){_TEMPLATE_MAP}"
+    )
 
-    return created_enemies
+    try:
+        result = run_query(query, bindings)
+        return [parse_enemy_template(template) for template in result]
+    except Exception as e:
+        logger.exception("Error creating enemy templates")
+        return []
+    finally:
+        clear_enemy_template_cache()
 
 
 def create_enemy_template(enemy_data: Dict) -> Optional[Dict]:
@@ -113,32 +264,15 @@ def create_enemy_template(enemy_data: Dict) -> Optional[Dict]:
     Create an enemy template in the database.
     """
     try:
-        # Convert lists to JSON strings for storage
-        loot_table_json = json.dumps(enemy_data.get("loot_table", []))
-        environment_json = json.dumps(enemy_data.get("environment", []))
-
-        query = (
-            f"g.addV('EnemyTemplate')"
-            f".property('enemy_id', '{enemy_data['enemy_id']}')"
-            f".property('name', '{enemy_data['name']}')"
-            f".property('level', {enemy_data['level']})"
-            f".property('max_hp', {enemy_data['max_hp']})"
-            f".property('dice_pool', '{enemy_data['dice_pool']}')"
-            f".property('xp_reward', {enemy_data['xp_reward']})"
-            f".property('loot_table', '{loot_table_json}')"
-            f".property('description', '{enemy_data['description']}')"
-            f".property('difficulty', '{enemy_data['difficulty']}')"
-            f".property('environment', '{environment_json}')"
-            f".elementMap()"
-        )
-
-        result = run_query(query)
+        step, bindings = _add_template_step(enemy_data, 0)
+        result = run_query(f"g.{step}{_TEMPLATE_MAP}", bindings)
+        clear_enemy_template_cache()
         if result:
             return parse_enemy_template(result[0])
         return None
 
     except Exception as e:
-        print(f"Error creating enemy template: {e}")
+        logger.exception("Error creating enemy template")
         return None
 
 
@@ -147,13 +281,10 @@ def get_all_enemy_templates() -> List[Dict]:
     Retrieve all enemy templates from the database.
     """
     try:
-        query = "g.V().hasLabel('EnemyTemplate').elementMap()"
-        result = run_query(query)
-
-        return [parse_enemy_template(template) for template in result]
+        return _load_all_enemy_templates()
 
     except Exception as e:
-        print(f"Error fetching enemy templates: {e}")
+        logger.exception("Error fetching enemy templates")
         return []
 
 
@@ -162,15 +293,10 @@ def get_enemy_template(enemy_id: str) -> Optional[Dict]:
     Retrieve a specific enemy template by ID.
     """
     try:
-        query = f"g.V().hasLabel('EnemyTemplate').has('enemy_id', '{enemy_id}').elementMap()"
-        result = run_query(query)
-
-        if result:
-            return parse_enemy_template(result[0])
-        return None
+        return _load_enemy_template(enemy_id)
 
     except Exception as e:
-        print(f"Error fetching enemy template {enemy_id}: {e}")
+        logger.exception("Error fetching enemy template %s", enemy_id)
         return None
 
 
@@ -179,13 +305,10 @@ def get_enemies_by_difficulty(difficulty: str) -> List[Dict]:
     Get enemy templates filtered by difficulty level.
     """
     try:
-        query = f"g.V().hasLabel('EnemyTemplate').has('difficulty', '{difficulty}').elementMap()"
-        result = run_query(query)
-
-        return [parse_enemy_template(template) for template in result]
+        return _load_enemies_by_difficulty(difficulty)
 
     except Exception as e:
-        print(f"Error fetching enemies by difficulty {difficulty}: {e}")
+        logger.exception("Error fetching enemies by difficulty %s", difficulty)
         return []
 
 
@@ -194,19 +317,24 @@ def get_enemies_by_environment(environment: str) -> List[Dict]:
     Get enemy templates that can appear in a specific environment.
     """
     try:
-        # This requires a more complex query since environment is stored as JSON
-        query = f"g.V().hasLabel('EnemyTemplate').where(__.values('environment').is(containing('{environment}'))).elementMap()"
-        result = run_query(query)
-
-        # Filter on the application side for more reliable results
-        enemies = [parse_enemy_template(template) for template in result]
-        return [enemy for enemy in enemies if environment in enemy.get('environment', [])]
+        return _load_enemies_by_environment(environment)
 
     except Exception as e:
-        print(f"Error fetching enemies by environment {environment}: {e}")
+        logger.exception("Error fetching enemies by environment %s", environment)
         return []
 
 
+@lru_cache(maxsize=1024)
+def _scale(template_hp: int, template_xp: int, template_level: int, character_level: int) -> tuple:
+    """Scaled (max_hp, xp_reward, level) for a template at a character level."""
+    level_bonus = max(1, character_level // 2) - 1
+    return (
+        template_hp + level_bonus * 5,
+        template_xp + level_bonus * 10,
+        template_level + level_bonus,
+    )
+
+
 def create_enemy_instance(template_id: str, character_level: int = 1) -> Optional[Dict]:
     """
     Create an enemy instance from a template for combat.
@@ -220,15 +348,15 @@ def create_enemy_instance(template_id: str, character_level: int = 1) -> Optiona
     instance_id = f"enemy_{uuid.uuid4().hex[:8]}"
 
     # Scale enemy stats based on character level (optional enhancement)
-    level_modifier = max(1, character_level // 2)
-    scaled_hp = template['max_hp'] + (level_modifier - 1) * 5
-    scaled_xp = template['xp_reward'] + (level_modifier - 1) * 10
+    scaled_hp, scaled_xp, scaled_level = _scale(
+        template['max_hp'], template['xp_reward'], template['level'], character_level
+    )
 
     enemy_instance = {
         "instance_id": instance_id,
         "template_id": template_id,
         "name": template['name'],
-        "level": template['level'] + max(0, level_modifier - 1),
+        "level": scaled_level,
         "max_hp": scaled_hp,
         "current_hp": scaled_hp,
         "dice_pool": template['dice_pool'],
@@ -247,77 +375,116 @@ def parse_enemy_template(template_data: Dict) -> Dict:
     Parse enemy template data from database format to application format.
     """
     try:
-        # Parse JSON fields
-        loot_table = template_data.get("loot_table")
-        if isinstance(loot_table, list):
-            loot_table = loot_table[0] if loot_table else "[]"
-        loot_table = json.loads(loot_table) if loot_table else []
+        def scalar(key):
+            value = template_data.get(key)
+            if type(value) is list:
+                return value[0] if value else None
+            return value
 
-        environment = template_data.get("environment")
-        if isinstance(environment, list):
-            environment = environment[0] if environment else "[]"
-        environment = json.loads(environment) if environment else []
+        def values(key):
+            # valueMap(true) already returns multi-properties as a list
+            return list(template_data.get(key) or [])
 
         return {
-            "enemy_id": template_data.get("enemy_id"),
-            "name": template_data.get("name"),
-            "level": template_data.get("level"),
-            "max_hp": template_data.get("max_hp"),
-            "dice_pool": template_data.get("dice_pool"),
-            "xp_reward": template_data.get("xp_reward"),
-            "loot_table": loot_table,
-            "description": template_data.get("description"),
-            "difficulty": template_data.get("difficulty"),
-            "environment": environment
+            "enemy_id": scalar("enemy_id"),
+            "name": scalar("name"),
+            "level": scalar("level"),
+            "max_hp": scalar("max_hp"),
+            "dice_pool": scalar("dice_pool"),
+            "xp_reward": scalar("xp_reward"),
+            "loot_table": values("loot_table"),
+            "description": scalar("description"),
+            "difficulty": scalar("difficulty"),
+            "environment": values("environment")
         }
     except Exception as e:
-        print(f"Error parsing enemy template: {e}")
+        logger.exception("Error parsing enemy template")
         return {}
 
 
+@lru_cache(maxsize=128)
+def _update_template_script(shape: tuple) -> str:
+    """
+    Update script for a sequence of fields. Each shape entry is None for a
+    single valued field, or the number of values written to a list field.
+    """
+    parts = ["g.", _TEMPLATE_BY_ID]
+    for i, size in enumerate(shape):
+        if size is None:
+            parts.append(f".property(single, k{i}, v{i})")
+        else:
+            # Replace every existing value of the multi-property
+            parts.append(f".sideEffect(properties(k{i}).drop())")
+            parts.extend(f".property(set, k{i}, v{i}_{n})" for n in range(size))
+    parts.append(_TEMPLATE_MAP)
+    return "".join(parts)
+
+
 def update_enemy_template(enemy_id: str, updates: Dict) -> Optional[Dict]:
     """
     Update an existing enemy template.
     """
     try:
-        # Build update query dynamically based on provided fields
-        update_parts = []
-        for key, value in updates.items():
-            if key in ['loot_table', 'environment'] and isinstance(value, list):
-                value = json.dumps(value)
-            if isinstance(value, str):
-                update_parts.append(f".property('{key}', '{value}')")
-            else:
-                update_parts.append(f".property('{key}', {value})")
-
-        if not update_parts:
+        if not updates:
             return None
 
-        query = (
-            f"g.V().hasLabel('EnemyTemplate').has('enemy_id', '{enemy_id}')"
-            f"{''.join(update_parts)}"
-            f".elementMap()"
-        )
+        # Keys and values are both bound; only the shape of the update picks
+        # the (cached) script
+        shape = []
+        bindings = {"eid": enemy_id}
+        for i, (key, value) in enumerate(updates.items()):
+            bindings[f"k{i}"] = key
+            if key in _LIST_FIELDS:
+                shape.append(len(value))
+                bindings.update((f"v{i}_{n}", item) for n, item in enumerate(value))
+            else:
+                shape.append(None)
+                bindings[f"v{i}"] = value
 
-        result = run_query(query)
+        result = run_query(_update_template_script(tuple(shape)), bindings)
+        clear_enemy_template_cache()
         if result:
             return parse_enemy_template(result[0])
         return None
 
     except Exception as e:
-        print(f"Error updating enemy template {enemy_id}: {e}")
+        logger.exception("Error updating enemy template %s", enemy_id)
         return None
 
 
+def migrate_legacy_enemy_templates() -> int:
+    """
+    Rewrite templates that still store loot_table/environment as JSON strings
+    into multi-properties. Returns the number of templates migrated.
+    """
+    migrated = 0
+    try:
+        for template in run_query(_LEGACY_TEMPLATES_QUERY):
+            enemy_id = template["enemy_id"][0]
+            updates = {}
+            for field in _LIST_FIELDS:
+                value = template.get(field) or []
+                if len(value) == 1 and value[0].startswith("["):
+                    updates[field] = json.loads(value[0])
+            if updates and update_enemy_template(enemy_id, updates):
+                migrated += 1
+    except Exception:
+        logger.exception("Error migrating legacy enemy templates")
+
+    if migrated:
+        logger.info("Migrated %s legacy enemy templates", migrated)
+    return migrated
+
+
 def delete_enemy_template(enemy_id: str) -> bool:
     """
     Delete an enemy template from the database.
     """
     try:
-        query = f"g.V().hasLabel('EnemyTemplate').has('enemy_id', '{enemy_id}').drop()"
-        result = run_query(query)
+        result = run_query(_DELETE_ENEMY_TEMPLATE_QUERY, {"eid": enemy_id})
+        clear_enemy_template_cache()
         return True
 
     except Exception as e:
-        print(f"Error deleting enemy template {enemy_id}: {e}")
+        logger.exception("Error deleting enemy template %s", enemy_id)
         return False
\ No newline at end of file
@@ -1,23 +1,289 @@
 # backend/app/models/habit.py - Enhanced version with better completion tracking
 
 import datetime
-import uuid
+import logging
+import threading
 import json
-
-from app.neptune_client import run_query
-from gremlin_python.process.traversal import T
-from app.models.completion import create_completion
+from secrets import randbits
+from functools import lru_cache
+from typing import List, Optional
+
+from cachetools import TTLCache
+from app.neptune_client import run_query, run_query_async
+from app.models.character import ATTRIBUTE_NAMES
+from app.models.queries import CHARACTER_BY_ID, HABIT_BY_ID
+
+logger = logging.getLogger(__name__)
+
+_VALID_ATTRIBUTES = frozenset(ATTRIBUTE_NAMES)
+
+# Gremlin scripts are built once at import. Values are always passed as
+# bindings, so the script text is identical on every call.
+
+# Only the properties the API returns are fetched; completion_history is
+# still read for habits that are not migrated yet.
+_HABIT_PROPERTIES = (
+    "elementMap('habit_id', 'character_id', 'habit_name', 'attribute',"
+    " 'description', 'completion_history')"
+)
+
+# Appended to a traversal over Habit vertices: each habit comes back paired
+# with its distinct completed dates, so a list of habits costs a single
+# round trip.
+_HABIT_WITH_COMPLETIONS = (
+    ".project('habit', 'completions')"
+    ".by(" + _HABIT_PROPERTIES + ")"
+    ".by(out('hasCompletion').hasLabel('HabitCompletion')"
+    ".has('completed', true)"
+    ".values('completion_date').dedup().fold())"
+)
+
+_CREATE_HABIT_QUERY = (
+    "g." + CHARACTER_BY_ID + ".as('c')"
+    ".addV('Habit')"
+    ".property(T.id, hid)"
+    ".property('habit_id', hid)"
+    ".property('character_id', cid)"
+    ".property('habit_name', habit_name)"
+    ".property('attribute', attribute)"
+    ".property('description', description)"
+    ".addE('hasHabit').from('c')"
+)
+
+# Neptune handles writes best in batches of up to about a hundred per traversal
+MAX_BULK_HABITS = 100
+
+
+@lru_cache(maxsize=MAX_BULK_HABITS)
+def _create_habits_script(count: int) -> str:
+    """
+    One traversal that creates `count` habits, bindings suffixed _<index>.
+    Each habit is its own project() column, so a missing character only
+    skips that habit: its column is [] instead of [habit_id].
+    """
+    columns = []
+    steps = []
+    for i in range(count):
+        columns.append(f"'h{i}'")
+        steps.append(
+            f".by(V(cid_{i}).hasLabel('Character').fold()"
+            f".coalesce(unfold(), V().hasLabel('Character').has('character_id', cid_{i}))"
+            f".as('c{i}')"
+            f".addV('Habit')"
+            f".property(T.id, hid_{i})"
+            f".property('habit_id', hid_{i})"
+            f".property('character_id', cid_{i})"
+            f".property('habit_name', habit_name_{i})"
+            f".property('attribute', attribute_{i})"
+            f".property('description', description_{i})"
+            f".addE('hasHabit').from('c{i}')"
+            f".inV().values('habit_id').fold())"
+        )
+    return "g.inject(0).project(" + ", ".join(columns) + ")" + "".join(steps)
+
+
+# Marking a day complete is one upsert: flag the existing completion for
+# that date, or create it and link it to the habit.
+_MARK_COMPLETED_QUERY = (
+    "g." + HABIT_BY_ID + ".as('h')"
+    ".coalesce("
+    "out('hasCompletion').has('completion_date', d)"
+    ".property('completed', true)"
+    ".project('completion_id', 'action').by(id).by(constant('updated')),"
+    "addV('HabitCompletion')"
+    ".property(id, completion_id)"
+    ".property('completion_date', d)"
+    ".property('completed', true)"
+    ".addE('hasCompletion').from('h').inV()"
+    ".project('completion_id', 'action').by(id).by(constant('created')))"
+)
+
+# Unmarking removes the day's completion and reports the ids it dropped
+_UNMARK_COMPLETED_QUERY = (
+    "g." + HABIT_BY_ID +
+    ".out('hasCompletion').has('completion_date', d)"
+    ".aggregate('dropped').by(id)"
+    ".drop()"
+    ".cap('dropped')"
+)
+
+# A batch of marks and unmarks goes out as one traversal with a project()
+# column per item, bindings suffixed _<index>. A mark column yields its
+# action ('updated' or 'created'; nothing if there is no such habit) and an
+# unmark column counts the completions it dropped. The by() steps run in
+# order, so repeated items see each other's writes.
+MAX_BULK_COMPLETIONS = 100
+
+
+@lru_cache(maxsize=256)
+def _update_completions_script(shape: tuple) -> str:
+    """One traversal applying len(shape) completion changes, shape[i] being item i's completed flag."""
+    columns = []
+    steps = []
+    for i, completed in enumerate(shape):
+        columns.append(f"'r{i}'")
+        habit = (
+            f"V(hid_{i}).hasLabel('Habit').fold()"
+            f".coalesce(unfold(), V().hasLabel('Habit').has('habit_id', hid_{i}))"
+        )
+        if completed:
+            steps.append(
+                f".by({habit}.as('h{i}')"
+                f".coalesce("
+                f"out('hasCompletion').has('completion_date', d_{i})"
+                f".property('completed', true).constant('updated'),"
+                f"addV('HabitCompletion')"
+                f".property(id, completion_id_{i})"
+                f".property('completion_date', d_{i})"
+                f".property('completed', true)"
+                f".addE('hasCompletion').from('h{i}').constant('created'))"
+                f".fold())"
+            )
+        else:
+            steps.append(
+                f".by({habit}.out('hasCompletion').has('completion_date', d_{i})"
+                f".sideEffect(drop()).count())"
+            )
+    return "g.inject(0).project(" + ", ".join(columns) + ")" + "".join(steps)
+
+
+_GET_HABIT_QUERY = "g." + HABIT_BY_ID + _HABIT_WITH_COMPLETIONS
+
+_CHARACTER_HABITS_QUERY = (
+    "g." + CHARACTER_BY_ID +
+    ".out('hasHabit').hasLabel('Habit')" + _HABIT_WITH_COMPLETIONS
+)
+
+# When the client only needs one day, each habit carries a completed flag
+# for that date instead of its whole completion history
+_CHARACTER_HABITS_ON_DATE_QUERY = (
+    "g." + CHARACTER_BY_ID +
+    ".out('hasHabit').hasLabel('Habit')"
+    ".project('habit', 'completed')"
+    ".by(" + _HABIT_PROPERTIES + ")"
+    ".by(choose(out('hasCompletion').hasLabel('HabitCompletion')"
+    ".has('completion_date', d).has('completed', true),"
+    " constant(true), constant(false)))"
+)
+
+# Walk from the character instead of scanning every Habit for character_id
+_HABITS_FOR_ATTRIBUTE_QUERY = (
+    "g." + CHARACTER_BY_ID +
+    ".out('hasHabit').hasLabel('Habit').has('attribute', attribute)"
+    + _HABIT_WITH_COMPLETIONS
+)
+
+_HABIT_CHARACTER_ID_QUERY = "g." + HABIT_BY_ID + ".values('character_id')"
+
+_HABIT_CHARACTER_IDS_QUERY = (
+    "g.V().hasLabel('Habit').has('habit_id', within(hids))"
+    ".project('habit_id', 'character_id')"
+    ".by(values('habit_id')).by(values('character_id'))"
+)
+
+_HABIT_COMPLETIONS_QUERY = "g." + HABIT_BY_ID + ".outE('hasCompletion').inV().elementMap()"
+
+# Habits created before HabitCompletion vertices existed keep their dates in
+# a completion_history JSON string
+_LEGACY_HISTORY_QUERY = (
+    "g.V().hasLabel('Habit').has('completion_history')"
+    ".project('habit_id', 'completion_history', 'dates')"
+    ".by(values('habit_id'))"
+    ".by(values('completion_history'))"
+    ".by(out('hasCompletion').values('completion_date').fold())"
+)
+
+# Create a completion for each missing date, then drop the JSON history
+_MIGRATE_HISTORY_QUERY = (
+    "g." + HABIT_BY_ID + ".as('h')"
+    ".sideEffect(constant(dates).unfold()"
+    ".addV('HabitCompletion')"
+    ".property('completion_date', identity())"
+    ".property('completed', true)"
+    ".addE('hasCompletion').from('h'))"
+    ".sideEffect(properties('completion_history').drop())"
+    ".values('habit_id')"
+)
+
+_DELETE_HABIT_QUERY = "g." + HABIT_BY_ID + ".drop()"
+
+# The character lookup is folded so a missing character still yields one
+# row; 'found' then tells it apart from a week without completions.
+# between() excludes its upper bound, so ed is the day after the range.
+# Neptune indexes every property, so the range needs no extra index DDL.
+_WEEK_COMPLETIONS_QUERY = (
+    "g." + CHARACTER_BY_ID + ".fold()"
+    ".project('found', 'completions')"
+    ".by(count(local))"
+    ".by(unfold().out('hasHabit').hasLabel('Habit').as('habit')"
+    ".out('hasCompletion').hasLabel('HabitCompletion')"
+    ".has('completion_date', between(sd, ed))"
+    ".as('completion')"
+    ".select('habit', 'completion')"
+    ".by(valueMap(true))"
+    ".by(valueMap(true))"
+    ".fold())"
+)
+
+_DAY_COMPLETIONS_QUERY = (
+    "g." + CHARACTER_BY_ID +
+    ".out('hasHabit').hasLabel('Habit').as('habit')"
+    ".out('hasCompletion').hasLabel('HabitCompletion')"
+    ".has('completion_date', today)"
+    ".as('completion')"
+    ".select('habit', 'completion')"
+    ".by(valueMap(true))"
+    ".by(valueMap(true))"
+)
+
+
+# A habit never moves to another character, so the mapping used for
+# ownership checks outlives completion marks and is only dropped on delete.
+_habit_character_cache = TTLCache(maxsize=50_000, ttl=600)
+_habit_character_lock = threading.Lock()
+
+
+def get_habit_character_id(habit_id: str) -> Optional[str]:
+    """The character_id a habit belongs to, or None if there is no such habit"""
+    with _habit_character_lock:
+        character_id = _habit_character_cache.get(habit_id)
+    if character_id is not None:
+        return character_id
+
+    result = run_query(_HABIT_CHARACTER_ID_QUERY, {"hid": habit_id})
+    if not result:
+        return None
+    with _habit_character_lock:
+        _habit_character_cache[habit_id] = result[0]
+    return result[0]
+
+
+def get_habit_character_ids(habit_ids) -> dict:
+    """The character_id of each existing habit in habit_ids, in at most one query"""
+    found = {}
+    with _habit_character_lock:
+        for habit_id in habit_ids:
+            character_id = _habit_character_cache.get(habit_id)
+            if character_id is not None:
+                found[habit_id] = character_id
+
+    missing = [habit_id for habit_id in habit_ids if habit_id not in found]
+    if missing:
+        rows = run_query(_HABIT_CHARACTER_IDS_QUERY, {"hids": missing})
+        with _habit_character_lock:
+            for row in rows:
+                found[row["habit_id"]] = row["character_id"]
+                _habit_character_cache[row["habit_id"]] = row["character_id"]
+    return found
 
 
 def generate_habit_id() -> str:
     """Generate a unique habit ID that fits in a 64-bit integer."""
-    return str(uuid.uuid4().int % (2 ** 63))
+    return str(randbits(63))
 
 
-def create_habit(character_id: str, habit_name: str, attribute: str, description: str = ""):
-    """
-    Create a Habit vertex and link it to the Character vertex.
-    """
+def _validate_habit(character_id: str, habit_name: str, attribute: str) -> str:
+    """Validate habit input and return the attribute lowercased."""
     # Input validation
     if not character_id or not character_id.strip():
         raise ValueError("Character ID cannot be empty")
@@ -26,33 +292,76 @@ def create_habit(character_id: str, habit_name: str, attribute: str, description
     if not attribute or not attribute.strip():
         raise ValueError("Attribute cannot be empty")
 
-    valid_attributes = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
-    if attribute.lower() not in valid_attributes:
-        raise ValueError(f"Attribute must be one of: {', '.join(valid_attributes)}")
+    attr = attribute.lower()
+    if attr not in _VALID_ATTRIBUTES:
+        raise ValueError(f"Attribute must be one of: {', '.join(ATTRIBUTE_NAMES)}")
+    return attr
+
+
+def create_habit(character_id: str, habit_name: str, attribute: str, description: str = ""):
+    """
+    Create a Habit vertex and link it to the Character vertex.
+    """
+    attr = _validate_habit(character_id, habit_name, attribute)
 
     try:
         habit_id = generate_habit_id()
-        # Initialize completion_history as an empty JSON array.
-        completions = "[]"
-
-        # Build the Gremlin query.
-        query = (
-            f"g.addV('Habit')"
-            f".property('habit_id', '{habit_id}')"
-            f".property('character_id', '{character_id}')"
-            f".property('habit_name', '{habit_name}')"
-            f".property('attribute', '{attribute.lower()}')"
-            f".property('description', '{description}')"
-            f".property('completion_history', '{completions}')"
-            f".as('h')"  # Label this vertex as 'h'
-            f".V().hasLabel('Character').has('character_id', '{character_id}').addE('hasHabit').to('h')"
-        )
-        print(f"Created Habit {habit_id}, {attribute}, {description}")
-        result = run_query(query)
+        logger.debug("Created Habit %s, %s, %s", habit_id, attribute, description)
+        result = run_query(_CREATE_HABIT_QUERY, {
+            "hid": habit_id,
+            "cid": character_id,
+            "habit_name": habit_name,
+            "attribute": attr,
+            "description": description or "",
+        })
         return {"habit_id": habit_id, "result": result}
-    except Exception as e:
-        print(f"Error creating Habit: {e}")
-        raise e
+    except Exception:
+        logger.exception("Error creating Habit")
+        raise
+
+
+def create_habits_bulk(items: List[dict]):
+    """
+    Create several habits in one traversal. Each item takes the same fields
+    as create_habit; all items are validated before anything is written.
+    habit_ids lists the habits created; missing_character_ids lists the
+    characters that were not found, whose habits were skipped.
+    """
+    if len(items) > MAX_BULK_HABITS:
+        raise ValueError(f"At most {MAX_BULK_HABITS} habits can be created at once")
+    attributes = [
+        _validate_habit(item.get("character_id"), item.get("habit_name"), item.get("attribute"))
+        for item in items
+    ]
+    if not items:
+        return {"habit_ids": [], "missing_character_ids": [], "result": []}
+
+    habit_ids = []
+    bindings = {}
+    for i, (item, attr) in enumerate(zip(items, attributes)):
+        habit_id = generate_habit_id()
+        habit_ids.append(habit_id)
+        bindings[f"hid_{i}"] = habit_id
+        bindings[f"cid_{i}"] = item["character_id"]
+        bindings[f"habit_name_{i}"] = item["habit_name"]
+        bindings[f"attribute_{i}"] = attr
+        bindings[f"description_{i}"] = item.get("description") or ""
+
+    try:
+        result = run_query(_create_habits_script(len(items)), bindings)
+        row = result[0] if result else {}
+        created = []
+        missing = []
+        for i, (item, habit_id) in enumerate(zip(items, habit_ids)):
+            if row.get(f"h{i}"):
+                created.append(habit_id)
+            elif item["character_id"] not in missing:
+                missing.append(item["character_id"])
+        logger.debug("Created %s of %s habits", len(created), len(habit_ids))
+        return {"habit_ids": created, "missing_character_ids": missing, "result": result}
+    except Exception:
+        logger.exception("Error creating habits")
+        raise
 
 
 def update_habit_completion(habit_id: str, completion_date: str = None, completed: bool = True):
@@ -62,79 +371,96 @@ def update_habit_completion(habit_id: str, completion_date: str = None, complete
         completion_date = datetime.date.today().isoformat()
 
     # Debug: log the values
-    print(f"Updating habit completion for habit_id: {habit_id} on {completion_date}, completed: {completed}")
-
-    # Check if completion already exists for this date
-    query_find = (
-        f"g.V().hasLabel('Habit').has('habit_id', '{habit_id}')"
-        f".outE('hasCompletion').inV()"
-        f".has('completion_date', '{completion_date}')"
-        f".id()"
-    )
-    find_result = run_query(query_find)
-    print("Find result:", find_result)
-
-    if find_result and len(find_result) > 0:
-        # A completion vertex exists—update its 'completed' property.
-        existing_completion_id = find_result[0]
-        query_update = (
-            f"g.V('{existing_completion_id}')"
-            f".property('completed', {str(completed).lower()})"
-        )
-        result = run_query(query_update)
+    logger.debug("Updating habit completion for habit_id: %s on %s, completed: %s",
+                 habit_id, completion_date, completed)
+
+    if completed:
+        result = run_query(_MARK_COMPLETED_QUERY, {
+            "hid": habit_id,
+            "d": completion_date,
+            "completion_id": str(randbits(63)),
+        })
+        if not result:
+            return {"message": "Habit not found"}
+        return {**result[0], "result": result}
+
+    dropped = run_query(_UNMARK_COMPLETED_QUERY, {"hid": habit_id, "d": completion_date})
+    dropped = dropped[0] if dropped else []
+    if not dropped:
+        # Marking as incomplete when no completion exists does nothing
+        return {"message": "No completion to remove for this date"}
+    return {"completion_id": dropped[0], "action": "deleted", "result": dropped}
+
+
+def update_habit_completions(items: List[dict]) -> List[dict]:
+    """
+    Mark or unmark several habit completions in one traversal. Each item
+    takes the same fields as update_habit_completion. Returns one
+    {"habit_id", "completion_date", "action"} per item, in order, with
+    action None where nothing changed (no such habit, or nothing to remove).
+    """
+    if len(items) > MAX_BULK_COMPLETIONS:
+        raise ValueError(f"At most {MAX_BULK_COMPLETIONS} completions can be updated at once")
+    if not items:
+        return []
 
-        # If marking as incomplete, we might want to remove the completion entirely
-        if not completed:
-            query_delete = f"g.V('{existing_completion_id}').drop()"
-            run_query(query_delete)
-            return {"completion_id": existing_completion_id, "action": "deleted", "result": result}
+    today = datetime.date.today().isoformat()
+    shape = []
+    bindings = {}
+    for i, item in enumerate(items):
+        completed = bool(item.get("completed", True))
+        shape.append(completed)
+        bindings[f"hid_{i}"] = item["habit_id"]
+        bindings[f"d_{i}"] = item.get("completion_date") or today
+        if completed:
+            bindings[f"completion_id_{i}"] = str(randbits(63))
 
-        return {"completion_id": existing_completion_id, "action": "updated", "result": result}
-    else:
-        # No existing completion for this date
+    result = run_query(_update_completions_script(tuple(shape)), bindings)
+
+    row = result[0] if result else {}
+    updates = []
+    for i, completed in enumerate(shape):
+        value = row.get(f"r{i}")
         if completed:
-            # Create a new completion vertex only if marking as complete
-            return create_completion(habit_id, completion_date, completed)
+            action = value[0] if value else None
         else:
-            # If trying to mark as incomplete but no completion exists, do nothing
-            return {"message": "No completion to remove for this date"}
+            action = "deleted" if value else None
+        updates.append({
+            "habit_id": bindings[f"hid_{i}"],
+            "completion_date": bindings[f"d_{i}"],
+            "action": action,
+        })
+    return updates
 
 
 def get_habit_with_completions(habit_id: str):
     """
     Retrieve a habit vertex with its completion data for the frontend
     """
-    # Get basic habit data
-    query = f"g.V().hasLabel('Habit').has('habit_id', '{habit_id}').elementMap()"
-    result = run_query(query)
+    # Get the habit and its completions in one round trip
+    result = run_query(_GET_HABIT_QUERY, {"hid": habit_id})
     if not result:
         return None
+    return _habit_from_row(result[0]["habit"], result[0]["completions"])
 
-    habit_data = result[0]
-
-    # Get all completions for this habit
-    completions_query = (
-        f"g.V().hasLabel('Habit').has('habit_id', '{habit_id}')"
-        f".outE('hasCompletion').inV().hasLabel('HabitCompletion')"
-        f".has('completed', true)"  # Only get completed ones
-        f".values('completion_date')"
-    )
-    completions_result = run_query(completions_query)
 
-    # Extract completion dates
-    completion_dates = completions_result if completions_result else []
-
-    # Parse the JSON completion history for backwards compatibility
+def _habit_from_row(habit_data: dict, completion_dates: list) -> dict:
+    """Build the API habit dict from its property map and completion dates."""
     completion_history = habit_data.get("completion_history")
     if isinstance(completion_history, list):
         completion_history = completion_history[0]
-    try:
-        legacy_completions = json.loads(completion_history) if completion_history else []
-    except Exception:
-        legacy_completions = []
 
-    # Combine legacy and new completion data
-    all_completions = list(set(completion_dates + legacy_completions))
+    if not completion_history or completion_history == "[]":
+        # Migrated and new habits keep every date on HabitCompletion vertices
+        legacy_completions = []
+        all_completions = completion_dates
+    else:
+        # Not yet migrated: parse the JSON completion history and merge it
+        try:
+            legacy_completions = json.loads(completion_history)
+        except Exception:
+            legacy_completions = []
+        all_completions = list(set(completion_dates + legacy_completions))
 
     habit = {
         "habit_id": habit_data.get("habit_id"),
@@ -149,60 +475,29 @@ def get_habit_with_completions(habit_id: str):
     return habit
 
 
-def get_all_habits_with_completions(character_id: str):
+async def get_all_habits_with_completions(character_id: str, selected_date: Optional[datetime.date] = None):
     """
-    Retrieve all habits for a character with their completion data
+    Retrieve all habits for a character with their completion data.
+    With selected_date, only that day's completion is fetched and returned
+    in each habit's completed flag.
     """
-    # Get all habits for the character
-    query = (
-        f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-        f".out('hasHabit').hasLabel('Habit').elementMap()"
-    )
-    result = run_query(query)
+    if selected_date is not None:
+        day = selected_date.isoformat()
+        result = await run_query_async(_CHARACTER_HABITS_ON_DATE_QUERY, {"cid": character_id, "d": day})
+        habits = []
+        for row in result or []:
+            habit = _habit_from_row(row["habit"], [day] if row["completed"] else [])
+            habit["completed"] = day in habit["completions"]
+            habits.append(habit)
+        return habits
+
+    # Fetch every habit together with its completion dates in one round trip
+    result = await run_query_async(_CHARACTER_HABITS_QUERY, {"cid": character_id})
 
     if not result:
         return []
 
-    habits_with_completions = []
-
-    for habit_data in result:
-        habit_id = habit_data.get("habit_id")
-
-        # Get completions for this habit
-        completions_query = (
-            f"g.V().hasLabel('Habit').has('habit_id', '{habit_id}')"
-            f".outE('hasCompletion').inV().hasLabel('HabitCompletion')"
-            f".has('completed', true)"
-            f".values('completion_date')"
-        )
-        completions_result = run_query(completions_query)
-        completion_dates = completions_result if completions_result else []
-
-        # Parse legacy completion history
-        completion_history = habit_data.get("completion_history")
-        if isinstance(completion_history, list):
-            completion_history = completion_history[0]
-        try:
-            legacy_completions = json.loads(completion_history) if completion_history else []
-        except Exception:
-            legacy_completions = []
-
-        # Combine all completion data
-        all_completions = list(set(completion_dates + legacy_completions))
-
-        habit = {
-            "habit_id": habit_data.get("habit_id"),
-            "character_id": habit_data.get("character_id"),
-            "habit_name": habit_data.get("habit_name"),
-            "attribute": habit_data.get("attribute"),
-            "description": habit_data.get("description"),
-            "completion_history": legacy_completions,
-            "completions": all_completions,
-            "completed": False  # Frontend will determine based on selected date
-        }
-        habits_with_completions.append(habit)
-
-    return habits_with_completions
+    return [_habit_from_row(row["habit"], row["completions"]) for row in result]
 
 
 # Update the existing functions to use the new enhanced versions
@@ -211,76 +506,79 @@ def get_habit(habit_id: str):
     return get_habit_with_completions(habit_id)
 
 
-def get_all_habits(character_id: str):
+async def get_all_habits(character_id: str, selected_date: Optional[datetime.date] = None):
     """Enhanced version that returns habits with completion data"""
-    return get_all_habits_with_completions(character_id)
+    return await get_all_habits_with_completions(character_id, selected_date)
 
 
-# Keep all other existing functions unchanged...
 def get_completions_for_habit(habit_id: str):
     """
     Retrieve all completion vertices associated with a habit.
     """
-    query = f"g.V().hasLabel('Habit').has('habit_id', '{habit_id}').outE('hasCompletion').inV().elementMap()"
-    result = run_query(query)
+    result = run_query(_HABIT_COMPLETIONS_QUERY, {"hid": habit_id})
     return result
 
 
 def get_habits_for_attribute(character_id: str, attribute: str):
     """Enhanced to include completion data"""
-    query = f"g.V().hasLabel('Habit').has('character_id', '{character_id}').has('attribute', '{attribute}').elementMap()"
-    result = run_query(query)
+    result = run_query(_HABITS_FOR_ATTRIBUTE_QUERY, {"cid": character_id, "attribute": attribute})
+
+    return [_habit_from_row(row["habit"], row["completions"]) for row in result or []]
 
-    # Enhance each habit with completion data
-    enhanced_habits = []
-    for habit_data in result:
-        habit_id = habit_data.get("habit_id")
-        if habit_id:
-            enhanced_habit = get_habit_with_completions(habit_id)
-            if enhanced_habit:
-                enhanced_habits.append(enhanced_habit)
 
-    return enhanced_habits
+def migrate_legacy_completion_history() -> int:
+    """
+    Move dates from legacy completion_history JSON strings onto
+    HabitCompletion vertices and drop the property. Returns the number of
+    habits migrated.
+    """
+    migrated = 0
+    try:
+        for habit in run_query(_LEGACY_HISTORY_QUERY):
+            try:
+                legacy_completions = json.loads(habit["completion_history"] or "[]")
+            except Exception:
+                legacy_completions = []
+            missing = sorted(set(legacy_completions) - set(habit["dates"]))
+            if run_query(_MIGRATE_HISTORY_QUERY, {"hid": habit["habit_id"], "dates": missing}):
+                migrated += 1
+    except Exception:
+        logger.exception("Error migrating legacy completion history")
+
+    if migrated:
+        logger.info("Migrated completion history of %s habits", migrated)
+    return migrated
 
 
 def delete_habit(habit_id: str):
     """
     Delete a habit vertex from the graph database using its ID.
     """
-    query = f"g.V().hasLabel('Habit').has('habit_id', '{habit_id}').drop()"
-    result = run_query(query)
+    try:
+        result = run_query(_DELETE_HABIT_QUERY, {"hid": habit_id})
+    finally:
+        with _habit_character_lock:
+            _habit_character_cache.pop(habit_id, None)
     return result
 
 
-def get_current_week_completions(character_id: str, start_date: datetime, end_date: datetime):
+async def get_current_week_completions(character_id: str, start_date: datetime.date, end_date: datetime.date):
     """Enhanced with path validation"""
-    start_date_str = start_date.strftime('%Y-%m-%d') if hasattr(start_date, 'strftime') else str(start_date)
-    end_date_str = end_date.strftime('%Y-%m-%d') if hasattr(end_date, 'strftime') else str(end_date)
-
-    # First, verify the character exists
-    char_check = f"g.V().hasLabel('Character').has('character_id', '{character_id}').count()"
-    if not run_query(char_check) or run_query(char_check)[0] == 0:
-        print(f"Character {character_id} not found")
+    rows = await run_query_async(_WEEK_COMPLETIONS_QUERY, {
+        "cid": character_id,
+        "sd": start_date.isoformat(),
+        "ed": (end_date + datetime.timedelta(days=1)).isoformat(),
+    })
+    if not rows or rows[0]["found"] == 0:
+        logger.debug("Character %s not found", character_id)
         return []
 
-    query = (
-        f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-        f".out('hasHabit').hasLabel('Habit').as('habit')"
-        f".out('hasCompletion').hasLabel('HabitCompletion')"
-        f".has('completion_date', gte('{start_date_str}'))"
-        f".has('completion_date', lte('{end_date_str}'))"
-        f".as('completion')"
-        f".select('habit', 'completion')"
-        f".by(valueMap(true))"
-        f".by(valueMap(true))"
-    )
-
-    result = run_query(query)
-    print(f"Week completions query returned: {len(result) if result else 0} results")
+    result = rows[0]["completions"]
+    logger.debug("Week completions query returned: %s results", len(result) if result else 0)
     return result or []
 
 
-def get_habits_for_character(character_id: str):
+async def get_habits_for_character(character_id: str):
     """
     Get all habits for a character - compatibility function for the auth router
     This function provides the interface expected by the new authenticated router
@@ -290,10 +588,10 @@ def get_habits_for_character(character_id: str):
 
     try:
         # Use the existing function that gets all habits with completions
-        return get_all_habits_with_completions(character_id)
-    except Exception as e:
-        print(f"Error getting habits for character {character_id}: {e}")
-        raise e
+        return await get_all_habits_with_completions(character_id)
+    except Exception:
+        logger.exception("Error getting habits for character %s", character_id)
+        raise
 
 def get_habit_by_id(habit_id: str):
     """
@@ -303,22 +601,9 @@ def get_habit_by_id(habit_id: str):
     return get_habit(habit_id)
 
 
-def get_current_day_completions(character_id: str, today: datetime):
+async def get_current_day_completions(character_id: str, today: datetime.date):
     """
     Get habit completions for a character for a specific day
     """
-    today_str = today.strftime('%Y-%m-%d') if hasattr(today, 'strftime') else str(today)
-
-    query = (
-        f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-        f".out('hasHabit').hasLabel('Habit').as('habit')"
-        f".out('hasCompletion').hasLabel('HabitCompletion')"
-        f".has('completion_date', '{today_str}')"
-        f".as('completion')"
-        f".select('habit', 'completion')"
-        f".by(valueMap(true))"
-        f".by(valueMap(true))"
-    )
-
-    result = run_query(query)
+    result = await run_query_async(_DAY_COMPLETIONS_QUERY, {"cid": character_id, "today": today.isoformat()})
     return result
\ No newline at end of file
@@ -0,0 +1,18 @@
+# backend/app/models/queries.py
+# Gremlin lookup fragments shared by several model modules. Values are
+# always passed as bindings, so these are plain script text.
+
+# New characters use their character_id as the vertex id, so lookups hit the
+# id index. Characters created before that only have the property, so fall
+# back to a property match when no vertex has the id. Binds cid.
+CHARACTER_BY_ID = (
+    "V(cid).hasLabel('Character').fold()"
+    ".coalesce(unfold(), V().hasLabel('Character').has('character_id', cid))"
+)
+
+# New habits use their habit_id as the vertex id so lookups hit the id
+# index; older habits are found by the property instead. Binds hid.
+HABIT_BY_ID = (
+    "V(hid).hasLabel('Habit').fold()"
+    ".coalesce(unfold(), V().hasLabel('Habit').has('habit_id', hid))"
+)
@@ -2,11 +2,165 @@
 # Updated with debug logging and user creation in Neptune
 
 import bcrypt
+import hashlib
+import logging
+import secrets
+import threading
 import uuid
-from typing import Optional, Dict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Dict, List
 from datetime import datetime
-from app.neptune_client import run_query
-import json
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
+from app.config import settings
+from app.neptune_client import run_query, run_query_async
+from app.models.queries import CHARACTER_BY_ID
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    "User",
+    "verify_unknown_user_password",
+    "create_user_in_neptune",
+    "create_user",
+    "get_user_by_email",
+    "get_user_by_id",
+    "link_character_to_user",
+    "CharacterRow",
+    "get_user_characters",
+    "get_owned_character_ids",
+    "get_owned_character_ids_async",
+    "invalidate_owned_characters",
+    "clear_user_cache",
+    "user_cache_info",
+]
+
+# Gremlin scripts are built once at import. Values are always passed as
+# bindings, so the script text is identical on every call.
+
+# New users use their user_id as the vertex id, so lookups hit the id index.
+# Users created before that only have the property, so fall back to a
+# property match when no vertex has the id.
+_USER_BY_ID = (
+    "V(uid).hasLabel('User').fold()"
+    ".coalesce(unfold(), V().hasLabel('User').has('user_id', uid))"
+)
+
+_USER_COUNT_QUERY = "g." + _USER_BY_ID + ".count()"
+
+_CREATE_NEPTUNE_USER_QUERY = (
+    "g.addV('User')"
+    ".property(T.id, uid)"
+    ".property('user_id', uid)"
+    ".property('email', email)"
+    ".property('created_at', now)"
+    ".property('is_active', true)"
+    ".property('is_premium', false)"
+    ".elementMap()"
+)
+
+# Insert-if-absent in one traversal: an existing email yields 'exists'
+# instead of a second user vertex.
+_CREATE_USER_QUERY = (
+    "g.V().hasLabel('User').has('email', email).fold()"
+    ".coalesce(unfold().constant('exists'), addV('User')"
+    ".property(T.id, uid)"
+    ".property('user_id', uid)"
+    ".property('email', email)"
+    ".property('password_hash', password_hash)"
+    ".property('created_at', now)"
+    ".property('is_active', true)"
+    ".property('is_premium', false)"
+    ".elementMap())"
+)
+
+# Identity lookups leave the password hash in the graph.
+_USER_FIELDS = "'user_id', 'email', 'is_active', 'is_premium', 'created_at'"
+
+_USER_BY_EMAIL_QUERY = "g.V().hasLabel('User').has('email', email).elementMap(" + _USER_FIELDS + ")"
+
+_USER_BY_ID_QUERY = "g." + _USER_BY_ID + ".elementMap(" + _USER_FIELDS + ")"
+
+# Only the summary fields are fetched. Setting an image_url drops the inline
+# image_data, and startup moves decodable blobs to files, so the only blobs
+# still read here belong to characters with no image_url to show instead.
+_USER_CHARACTERS_QUERY = (
+    "g." + _USER_BY_ID +
+    ".out('owns').hasLabel('Character')"
+    ".elementMap('character_id', 'name', 'level', 'current_xp', 'image_url', 'image_data')"
+)
+
+# Ownership checks only need the ids, not the character summaries
+_USER_CHARACTER_IDS_QUERY = (
+    "g." + _USER_BY_ID +
+    ".out('owns').hasLabel('Character')"
+    ".values('character_id')"
+)
+
+_LINK_CHARACTER_QUERY = (
+    "g.V(uid).hasLabel('User').fold()"
+    ".coalesce(unfold(), V().hasLabel('User').has('user_id', uid), addV('User')"
+    ".property(T.id, uid)"
+    ".property('user_id', uid)"
+    ".property('email', 'temp@example.com')"
+    ".property('created_at', now)"
+    ".property('is_active', true)"
+    ".property('is_premium', false))"
+    ".addE('owns').to(" + CHARACTER_BY_ID + ")"
+)
+
+# User rows change rarely, so lookups by email and by id are served from
+# memory for a few minutes. Only found users are cached, so a user created
+# by another worker is visible on the next lookup.
+_user_cache = TTLCache(maxsize=10_000, ttl=300)
+_user_cache_lock = threading.RLock()
+_user_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _cached_user(key: tuple) -> Optional[Dict]:
+    with _user_cache_lock:
+        user = _user_cache.get(key)
+        _user_cache_stats["hits" if user is not None else "misses"] += 1
+        return user
+
+
+def _cache_user(key: tuple, user: Dict):
+    with _user_cache_lock:
+        _user_cache[key] = user
+
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+    with _verify_cache_lock:
+        _verify_cache.clear()
+
+
+def user_cache_info() -> Dict:
+    """Hit/miss counters and current size of the user lookup cache"""
+    with _user_cache_lock:
+        return {**_user_cache_stats, "size": len(_user_cache), "maxsize": _user_cache.maxsize}
+
+
+# Argon2id parameters for new password hashes, tunable through
+# ARGON2_TIME_COST / ARGON2_MEMORY_COST. Hashes made with other parameters
+# (or with bcrypt, which older accounts still use) are replaced on the next
+# successful login.
+_password_hasher = PasswordHasher(
+    time_cost=settings.argon2_time_cost,
+    memory_cost=settings.argon2_memory_cost,
+    parallelism=1,
+)
+
+
+# Successful password checks are remembered briefly, so a client presenting
+# the same credentials repeatedly skips the deliberately slow hash. The key
+# covers the stored hash, so a changed password never matches an old entry.
+# Failures are not cached.
+_verify_cache = TTLCache(maxsize=4096, ttl=60)
+_verify_cache_lock = threading.Lock()
 
 
 class User:
@@ -17,74 +171,100 @@ class User:
 
     @staticmethod
     def hash_password(password: str) -> str:
-        """Hash password using bcrypt"""
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed.decode('utf-8')
+        """Hash password using Argon2id"""
+        return _password_hasher.hash(password)
 
     @staticmethod
     def verify_password(password: str, hashed: str) -> bool:
-        """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        """Verify password against an Argon2 or legacy bcrypt hash"""
+        password_bytes = password.encode('utf-8')
+        hashed_bytes = hashed.encode('utf-8')
+        key = hashlib.sha256(password_bytes + b"\0" + hashed_bytes).digest()
+        with _verify_cache_lock:
+            if key in _verify_cache:
+                return True
+
+        if hashed.startswith("$2"):
+            valid = bcrypt.checkpw(password_bytes, hashed_bytes)
+        else:
+            try:
+                valid = _password_hasher.verify(hashed, password)
+            except (VerificationError, InvalidHashError):
+                valid = False
+
+        if valid:
+            with _verify_cache_lock:
+                _verify_cache[key] = True
+        return valid
+
+    @staticmethod
+    def needs_rehash(hashed: str) -> bool:
+        """True for bcrypt hashes and Argon2 hashes with outdated parameters"""
+        return hashed.startswith("$2") or _password_hasher.check_needs_rehash(hashed)
+
+    @staticmethod
+    def rehash_if_needed(password: str, hashed: str) -> Optional[str]:
+        """Return a fresh hash of a verified password if the stored one is outdated"""
+        if User.needs_rehash(hashed):
+            return User.hash_password(password)
+        return None
+
+
+@lru_cache(maxsize=1)
+def _unknown_user_hash() -> str:
+    return User.hash_password(secrets.token_urlsafe(16))
+
+
+def verify_unknown_user_password(password: str) -> bool:
+    """
+    Spend the same time as a real password check, then fail. Logins for
+    unknown emails call this so their latency does not reveal which
+    emails are registered.
+    """
+    User.verify_password(password, _unknown_user_hash())
+    return False
 
 
 def create_user_in_neptune(user_id: str, email: str) -> bool:
     """Create a user node in Neptune Graph"""
     try:
-        print(f"Creating user in Neptune: {user_id}, {email}")
+        logger.debug("Creating user in Neptune: %s, %s", user_id, email)
 
         # Check if user already exists
-        check_query = f"g.V().hasLabel('User').has('user_id', '{user_id}').count()"
-        existing_count = run_query(check_query)
-        print(f"Existing user count: {existing_count}")
+        existing_count = run_query(_USER_COUNT_QUERY, {"uid": user_id})
 
         if existing_count and existing_count[0] > 0:
-            print(f"User {user_id} already exists in Neptune")
+            logger.debug("User %s already exists in Neptune", user_id)
             return True
 
-        query = (
-            f"g.addV('User')"
-            f".property('user_id', '{user_id}')"
-            f".property('email', '{email}')"
-            f".property('created_at', '{datetime.utcnow().isoformat()}')"
-            f".property('is_active', true)"
-            f".property('is_premium', false)"
-            f".elementMap()"
-        )
-
-        result = run_query(query)
-        print(f"User creation result: {result}")
+        result = run_query(_CREATE_NEPTUNE_USER_QUERY, {
+            "uid": user_id,
+            "email": email,
+            "now": datetime.utcnow().isoformat(),
+        })
+        logger.debug("User creation result: %s", result)
         return True
 
-    except Exception as e:
-        print(f"Error creating user in Neptune: {e}")
+    except Exception:
+        logger.exception("Error creating user in Neptune")
         return False
 
 
 def create_user(email: str, password: str) -> Optional[Dict]:
     """Create a new user in the database"""
     try:
-        # Check if user already exists
-        existing = get_user_by_email(email)
-        if existing:
-            return None
-
         user_id = str(uuid.uuid4())
         hashed_password = User.hash_password(password)
 
-        query = (
-            f"g.addV('User')"
-            f".property('user_id', '{user_id}')"
-            f".property('email', '{email}')"
-            f".property('password_hash', '{hashed_password}')"
-            f".property('created_at', '{datetime.utcnow().isoformat()}')"
-            f".property('is_active', true)"
-            f".property('is_premium', false)"
-            f".elementMap()"
-        )
-
-        result = run_query(query)
-        if result:
+        result = run_query(_CREATE_USER_QUERY, {
+            "uid": user_id,
+            "email": email,
+            "password_hash": hashed_password,
+            "now": datetime.utcnow().isoformat(),
+        })
+        with _user_cache_lock:
+            _user_cache.pop(("email", email), None)
+        if result and result[0] != 'exists':
             return {
                 "user_id": user_id,
                 "email": email,
@@ -92,141 +272,154 @@ def create_user(email: str, password: str) -> Optional[Dict]:
             }
         return None
 
-    except Exception as e:
-        print(f"Error creating user: {e}")
+    except Exception:
+        logger.exception("Error creating user")
         return None
 
 
 def get_user_by_email(email: str) -> Optional[Dict]:
     """Retrieve user by email"""
+    cached = _cached_user(("email", email))
+    if cached is not None:
+        return cached
+
     try:
-        query = f"g.V().hasLabel('User').has('email', '{email}').elementMap()"
-        result = run_query(query)
+        result = run_query(_USER_BY_EMAIL_QUERY, {"email": email})
 
         if result:
-            user_data = result[0]
-            return {
-                "user_id": user_data.get('user_id'),
-                "email": user_data.get('email'),
-                "password_hash": user_data.get('password_hash'),
-                "is_active": user_data.get('is_active', True),
-                "is_premium": user_data.get('is_premium', False),
-                "created_at": user_data.get('created_at')
-            }
+            user = _user_from_row(result[0])
+            _cache_user(("email", email), user)
+            return user
         return None
 
-    except Exception as e:
-        print(f"Error fetching user: {e}")
+    except Exception:
+        logger.exception("Error fetching user")
         return None
 
 
+def _user_from_row(user_data: Dict) -> Dict:
+    return {
+        "user_id": user_data.get('user_id'),
+        "email": user_data.get('email'),
+        "is_active": user_data.get('is_active', True),
+        "is_premium": user_data.get('is_premium', False),
+        "created_at": user_data.get('created_at')
+    }
+
+
 def get_user_by_id(user_id: str) -> Optional[Dict]:
     """Retrieve user by ID"""
+    cached = _cached_user(("id", user_id))
+    if cached is not None:
+        return cached
+
     try:
-        query = f"g.V().hasLabel('User').has('user_id', '{user_id}').elementMap()"
-        result = run_query(query)
+        result = run_query(_USER_BY_ID_QUERY, {"uid": user_id})
 
         if result:
-            user_data = result[0]
-            return {
-                "user_id": user_data.get('user_id'),
-                "email": user_data.get('email'),
-                "is_active": user_data.get('is_active', True),
-                "is_premium": user_data.get('is_premium', False),
-                "created_at": user_data.get('created_at')
-            }
+            user = _user_from_row(result[0])
+            _cache_user(("id", user_id), user)
+            return user
         return None
 
-    except Exception as e:
-        print(f"Error fetching user by ID: {e}")
+    except Exception:
+        logger.exception("Error fetching user by ID")
         return None
 
 
 def link_character_to_user(user_id: str, character_id: str) -> bool:
     """Create ownership edge between user and character"""
     try:
-        print(f"Linking character {character_id} to user {user_id}")
-
-        # First ensure the user exists in Neptune
-        user_exists = get_user_by_id(user_id)
-        if not user_exists:
-            print(f"User {user_id} doesn't exist in Neptune, creating...")
-            # We need email, but we don't have it here. This is the problem!
-            # For now, let's create a minimal user node
-            create_query = (
-                f"g.addV('User')"
-                f".property('user_id', '{user_id}')"
-                f".property('email', 'temp@example.com')"  # Temporary email
-                f".property('created_at', '{datetime.utcnow().isoformat()}')"
-                f".property('is_active', true)"
-                f".property('is_premium', false)"
-            )
-            run_query(create_query)
-            print(f"Created user node for {user_id}")
-
-        # Now create the ownership edge
-        query = (
-            f"g.V().hasLabel('User').has('user_id', '{user_id}')"
-            f".addE('owns')"
-            f".to(V().hasLabel('Character').has('character_id', '{character_id}'))"
-        )
-
-        result = run_query(query)
-        print(f"Link creation result: {result}")
+        logger.debug("Linking character %s to user %s", character_id, user_id)
+
+        # Ensure the user vertex exists and add the ownership edge in one
+        # traversal. Users linked before they were stored in Neptune get a
+        # minimal node, since there is no email to hand here.
+        result = run_query(_LINK_CHARACTER_QUERY, {
+            "uid": user_id,
+            "cid": character_id,
+            "now": datetime.utcnow().isoformat(),
+        })
+        invalidate_owned_characters(user_id)
+        logger.debug("Link creation result: %s", result)
         return True
 
-    except Exception as e:
-        print(f"Error linking character to user: {e}")
+    except Exception:
+        logger.exception("Error linking character to user")
         return False
 
 
-def get_user_characters(user_id: str) -> list:
+@dataclass(slots=True)
+class CharacterRow:
+    """Summary of a character owned by a user"""
+    character_id: str
+    name: str
+    level: int = 1
+    current_xp: int = 0
+    image_data: Optional[str] = None
+    image_url: Optional[str] = None
+
+
+def get_user_characters(user_id: str) -> List[CharacterRow]:
     """Get all characters owned by a user"""
     try:
-        print(f"Getting characters for user: {user_id}")
+        # A missing user simply owns no characters
+        result = run_query(_USER_CHARACTERS_QUERY, {"uid": user_id})
 
-        # First check if user exists
-        user_check_query = f"g.V().hasLabel('User').has('user_id', '{user_id}').count()"
-        user_count = run_query(user_check_query)
-        print(f"User count in Neptune: {user_count}")
+        characters = []
+        for char_data in result:
+            image_url = char_data.get('image_url')
+            characters.append(CharacterRow(
+                char_data.get('character_id'),
+                char_data.get('name'),
+                char_data.get('level', 1),
+                char_data.get('current_xp', 0),
+                char_data.get('image_data') or image_url,
+                image_url,
+            ))
+
+        logger.debug("Returning %s characters for user %s", len(characters), user_id)
+        return characters
 
-        if not user_count or user_count[0] == 0:
-            print(f"User {user_id} not found in Neptune!")
-            return []
+    except Exception:
+        logger.exception("Error fetching user characters")
+        return []
 
-        # Debug: Check all User nodes
-        all_users_query = "g.V().hasLabel('User').elementMap()"
-        all_users = run_query(all_users_query)
-        print(f"All users in Neptune: {[user.get('user_id') for user in all_users]}")
 
-        # Debug: Check ownership edges from this user
-        edges_query = f"g.V().hasLabel('User').has('user_id', '{user_id}').outE('owns').count()"
-        edge_count = run_query(edges_query)
-        print(f"Ownership edges from user {user_id}: {edge_count}")
+# Ownership checks guard nearly every character, habit and adventure
+# endpoint, so each user's set of character ids is kept for a minute.
+# Creating or deleting a character drops the entry. A failed query raises
+# instead of caching an empty set.
+_owned_characters_cache = TTLCache(maxsize=10_000, ttl=60)
+_owned_characters_lock = threading.Lock()
 
-        query = (
-            f"g.V().hasLabel('User').has('user_id', '{user_id}')"
-            f".out('owns').hasLabel('Character').elementMap()"
-        )
 
-        result = run_query(query)
-        print(f"Characters query result: {result}")
+def get_owned_character_ids(user_id: str) -> frozenset:
+    """Ids of the characters owned by a user"""
+    with _owned_characters_lock:
+        owned = _owned_characters_cache.get(user_id)
+    if owned is not None:
+        return owned
 
-        characters = []
+    owned = frozenset(run_query(_USER_CHARACTER_IDS_QUERY, {"uid": user_id}))
+    with _owned_characters_lock:
+        _owned_characters_cache[user_id] = owned
+    return owned
+
+
+async def get_owned_character_ids_async(user_id: str) -> frozenset:
+    """Awaitable get_owned_character_ids, sharing its cache"""
+    with _owned_characters_lock:
+        owned = _owned_characters_cache.get(user_id)
+    if owned is not None:
+        return owned
+
+    owned = frozenset(await run_query_async(_USER_CHARACTER_IDS_QUERY, {"uid": user_id}))
+    with _owned_characters_lock:
+        _owned_characters_cache[user_id] = owned
+    return owned
 
-        for char_data in result:
-            print(f"Processing character data: {char_data}")
-            characters.append({
-                "character_id": char_data.get('character_id'),
-                "name": char_data.get('name'),
-                "level": char_data.get('level', 1),
-                "current_xp": char_data.get('current_xp', 0),
-                "image_data": char_data.get('image_data')
-            })
-
-        print(f"Returning {len(characters)} characters")
-        return characters
 
-    except Exception as e:
-        print(f"Error fetching user characters: {e}")
-        return []
\ No newline at end of file
+def invalidate_owned_characters(user_id: str):
+    with _owned_characters_lock:
+        _owned_characters_cache.pop(user_id, None)
@@ -1,101 +1,262 @@
 # backend/app/neptune_client.py
+import asyncio
+import atexit
 import logging
-import os
+import queue
+import threading
 
-from typing import List, Any
+import aiohttp
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Dict, Iterator, Optional
 from gremlin_python.driver import client, serializer
-from pydantic.v1.networks import host_regex
+from app.config import settings
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=settings.log_level)
 logger = logging.getLogger(__name__)
 
-# Get the Neptune endpoint from an environment variable or hardcode for development.
-NEPTUNE_ENDPOINT = os.getenv("NEPTUNE_ENDPOINT", "ws://localhost:8182/gremlin")
-NEPTUNE_PORT = os.getenv("NEPTUNE_PORT", 8182)
+__all__ = [
+    "NEPTUNE_URL",
+    "get_gremlin_client",
+    "run_query",
+    "iter_query",
+    "run_query_async",
+    "debug_character_habits",
+    "debug_habit_completions",
+    "debug_full_path",
+    "init_neptune_client",
+    "warm_neptune_pool",
+    "close_neptune_client",
+]
+
+# Neptune connection details come from the shared settings object.
+NEPTUNE_ENDPOINT = settings.neptune_endpoint
+NEPTUNE_PORT = settings.neptune_port
+NEPTUNE_URL = settings.neptune_url
+
+# Number of pooled websocket connections (and driver worker threads)
+POOL_SIZE = settings.neptune_pool_size
+
+# Results per response frame when streaming with iter_query
+STREAM_BATCH_SIZE = 1000
+
+
+def _create_client() -> client.Client:
+    """Create a pooled Gremlin client using the GraphSON v3 serializer."""
+    return client.Client(
+        NEPTUNE_URL,
+        'g',
+        pool_size=POOL_SIZE,
+        max_workers=POOL_SIZE,
+        message_serializer=serializer.GraphSONSerializersV3d0()
+    )
+
+
+# One pooled client is shared by every query in the process. It is created
+# on first use, so importing this module never opens sockets.
+gremlin_client: Optional[client.Client] = None
+_client_lock = threading.Lock()
+
+
+def get_gremlin_client() -> client.Client:
+    """Return the shared Gremlin client, creating it if needed."""
+    global gremlin_client
+    current = gremlin_client
+    if current is not None and not current.is_closed():
+        return current
+    with _client_lock:
+        if gremlin_client is None or gremlin_client.is_closed():
+            gremlin_client = _create_client()
+        return gremlin_client
 
-# Create a Gremlin client using GraphSON v2 serializer
-gremlin_client = client.Client(NEPTUNE_ENDPOINT, 'g',
-    message_serializer=serializer.GraphSONSerializersV3d0()
-)
 
+# Errors the driver's transport raises when a pooled connection fails to open
+_CONNECT_ERRORS = (aiohttp.ClientError, OSError, asyncio.TimeoutError)
 
-def run_query(query: str) -> List[Any]:
-    """Submit a Gremlin query and return all results with better error handling."""
+
+def _replace_client(failed: client.Client) -> None:
+    """Swap in a fresh client for one whose pool lost a connection."""
+    global gremlin_client
+    with _client_lock:
+        if gremlin_client is not failed:
+            # Another thread already replaced it
+            return
+        gremlin_client = _create_client()
+    failed.close()
+    logger.warning("Neptune connection failed to open; Gremlin client recreated")
+
+
+def _submit(query: str, bindings: Optional[Dict[str, Any]] = None,
+            request_options: Optional[Dict[str, Any]] = None):
+    """Submit a query, keeping the driver's connection pool at full size."""
+    gremlin = get_gremlin_client()
+    try:
+        return gremlin.submit_async(query, bindings=bindings, request_options=request_options)
+    except _CONNECT_ERRORS:
+        # A connection that fails to open is never returned to the driver's
+        # pool, so start over with a fresh client instead of a drained one.
+        _replace_client(gremlin)
+        raise
+
+
+def run_query(query: str, bindings: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """
+    Submit a Gremlin query and return all results with better error handling.
+    Values referenced by name in the query are passed separately in bindings,
+    so they never have to be quoted or escaped into the query text.
+    """
     if not query or not query.strip():
         raise ValueError("Query cannot be empty")
 
     try:
-        callback = gremlin_client.submit_async(query)
+        callback = _submit(query, bindings)
         if callback.result() is not None:
             result = callback.result().all().result()
-            logger.info(f"Query executed successfully: {query[:100]}...")
+            logger.info("Query executed successfully: %.100s...", query)
             return result
         return []
     except ConnectionError as e:
-        logger.error(f"Database connection error: {e}")
+        logger.error("Database connection error: %s", e)
         raise RuntimeError("Database connection failed")
     except Exception as e:
-        logger.error(f"Error running query: {query}\nException: {e}")
+        logger.error("Error running query: %s\nException: %s", query, e)
         raise RuntimeError(f"Database query failed: {str(e)}")
 
+
+def iter_query(query: str, bindings: Optional[Dict[str, Any]] = None,
+               batch_size: int = STREAM_BATCH_SIZE) -> Iterator[Any]:
+    """
+    Yield query results as each response batch arrives instead of waiting
+    for (and holding) the complete result list.
+    """
+    if not query or not query.strip():
+        raise ValueError("Query cannot be empty")
+
+    try:
+        result_set = _submit(query, bindings, {"batchSize": batch_size}).result()
+        if result_set is None:
+            return
+        # ResultSet's own iterator busy-waits on the stream; block on the
+        # queue instead and stop once the request has completed.
+        stream, done = result_set.stream, result_set.done
+        while True:
+            try:
+                yield from stream.get(timeout=0.05)
+            except queue.Empty:
+                if done.done():
+                    while not stream.empty():
+                        yield from stream.get_nowait()
+                    done.result()
+                    break
+        logger.info("Query streamed successfully: %.100s...", query)
+    except ConnectionError as e:
+        logger.error("Database connection error: %s", e)
+        raise RuntimeError("Database connection failed")
+    except Exception as e:
+        logger.error("Error running query: %s\nException: %s", query, e)
+        raise RuntimeError(f"Database query failed: {str(e)}")
+
+
+async def run_query_async(query: str, bindings: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """Awaitable version of run_query that does not block the event loop."""
+    if not query or not query.strip():
+        raise ValueError("Query cannot be empty")
+
+    try:
+        # submit_async can block (waiting for a free pooled connection, or
+        # opening it on first use with the driver's own event loop), so hand
+        # the submission to a thread and only await the result futures here.
+        write_future = await asyncio.to_thread(_submit, query, bindings)
+        result_set = await asyncio.wrap_future(write_future)
+        if result_set is None:
+            return []
+        result = await asyncio.wrap_future(result_set.all())
+        logger.info("Query executed successfully: %.100s...", query)
+        return result
+    except ConnectionError as e:
+        logger.error("Database connection error: %s", e)
+        raise RuntimeError("Database connection failed")
+    except Exception as e:
+        logger.error("Error running query: %s\nException: %s", query, e)
+        raise RuntimeError(f"Database query failed: {str(e)}")
+
+
 def debug_character_habits(character_id: str):
     """Debug function to check Character -> Habit relationships"""
     query = (
-        f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-        f".out('hasHabit').hasLabel('Habit')"
-        f".valueMap('habit_id', 'habit_name')"
+        "g.V().hasLabel('Character').has('character_id', cid)"
+        ".out('hasHabit').hasLabel('Habit')"
+        ".valueMap('habit_id', 'habit_name')"
     )
-    result = run_query(query)
-    print(f"Habits for character {character_id}: {result}")
+    result = run_query(query, {"cid": character_id})
+    logger.debug("Habits for character %s: %s", character_id, result)
     return result
 
 def debug_habit_completions(habit_id: str):
     """Debug function to check Habit -> Completion relationships"""
     query = (
-        f"g.V().hasLabel('Habit').has('habit_id', '{habit_id}')"
-        f".out('hasCompletion').hasLabel('HabitCompletion')"
-        f".valueMap('completion_date', 'completed')"
+        "g.V().hasLabel('Habit').has('habit_id', hid)"
+        ".out('hasCompletion').hasLabel('HabitCompletion')"
+        ".valueMap('completion_date', 'completed')"
     )
-    result = run_query(query)
-    print(f"Completions for habit {habit_id}: {result}")
+    result = run_query(query, {"hid": habit_id})
+    logger.debug("Completions for habit %s: %s", habit_id, result)
     return result
 
 def debug_full_path(character_id: str):
     """Debug the full Character -> Habit -> Completion path"""
     query = (
-        f"g.V().hasLabel('Character').has('character_id', '{character_id}')"
-        f".out('hasHabit').hasLabel('Habit').as('habit')"
-        f".out('hasCompletion').hasLabel('HabitCompletion').as('completion')"
-        f".select('habit', 'completion')"
-        f".by(valueMap('habit_id', 'habit_name'))"
-        f".by(valueMap('completion_date', 'completed'))"
+        "g.V().hasLabel('Character').has('character_id', cid)"
+        ".out('hasHabit').hasLabel('Habit').as('habit')"
+        ".out('hasCompletion').hasLabel('HabitCompletion').as('completion')"
+        ".select('habit', 'completion')"
+        ".by(valueMap('habit_id', 'habit_name'))"
+        ".by(valueMap('completion_date', 'completed'))"
     )
-    result = run_query(query)
-    print(f"Full path for character {character_id}: {result}")
+    result = run_query(query, {"cid": character_id})
+    logger.debug("Full path for character %s: %s", character_id, result)
     return result
 
 
 def init_neptune_client():
-    """Initialize the Gremlin client."""
-    global neptune_client
-    host = NEPTUNE_ENDPOINT
-    port = NEPTUNE_PORT
-    url = f"ws://{host}:{port}/gremlin"
-
-    neptune_client = client.Client(
-        url,
-        'g',
-        username="",
-        password="",
-        message_serializer=serializer.GraphSONSerializersV3d0()()
-    )
-    print(f"Gremlin client initialized: {url}")
+    """Initialize the Gremlin client used by run_query."""
+    get_gremlin_client()
+    logger.info("Gremlin client initialized: %s", NEPTUNE_URL)
+
+
+def _warm_pool():
+    """Run one trivial query per pooled connection, all at the same time."""
+    with ThreadPoolExecutor(max_workers=POOL_SIZE) as executor:
+        futures = [executor.submit(run_query, "g.inject(1)") for _ in range(POOL_SIZE)]
+    failures = [f.exception() for f in futures if f.exception() is not None]
+    if not failures:
+        logger.info("Warmed %s Neptune connections", POOL_SIZE)
+        return
+
+    # The API still starts without the database; /health reports it.
+    # _submit has already replaced the client if a connection failed to open.
+    logger.warning("Neptune warm-up failed: %s", failures[0])
+
+
+async def warm_neptune_pool():
+    """
+    Open every pooled connection up front so the first requests after startup
+    don't pay the TCP/TLS/websocket handshake.
+    """
+    # The driver opens connections on its own event loop, so this has to
+    # happen off the application's loop.
+    await asyncio.to_thread(_warm_pool)
 
 
 def close_neptune_client():
-    global neptune_client
-    if neptune_client:
-        neptune_client.close()
-        print(f"Neptune client closed")
-    neptune_client = None
+    global gremlin_client
+    with _client_lock:
+        if gremlin_client:
+            gremlin_client.close()
+            logger.info("Neptune client closed")
+        gremlin_client = None
+
 
+# Scripts and workers that never run the FastAPI lifespan still close the
+# pooled websockets on interpreter exit.
+atexit.register(close_neptune_client)
@@ -4,11 +4,24 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer
 from pydantic import BaseModel
-from typing import Optional
+from typing import NamedTuple, Optional
+import hashlib
 import jwt
+import logging
 import os
-from datetime import datetime, timedelta
-from app.models.user import create_user_in_neptune
+import threading
+import time
+import uuid
+from cachetools import TTLCache
+from app.models.user import (
+    User,
+    create_user_in_neptune,
+    get_owned_character_ids_async,
+    verify_unknown_user_password,
+)
+from app.neptune_client import run_query
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -20,6 +33,12 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-this-in-production")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRATION_HOURS = int(os.getenv("JWT_EXPIRATION_HOURS", "24"))
+JWT_EXPIRATION_SECONDS = JWT_EXPIRATION_HOURS * 3600
+_JWT_ALGORITHMS = [JWT_ALGORITHM]
+
+# Reject tokens whose user is missing from the in-memory store (e.g. after a
+# restart). Off by default; the token signature is what authenticates.
+AUTH_STRICT_USER_CHECK = os.getenv("AUTH_STRICT_USER_CHECK", "0") == "1"
 
 
 class RegisterRequest(BaseModel):
@@ -36,26 +55,77 @@ class TokenResponse(BaseModel):
 
 def create_access_token(user_id: str, email: str) -> str:
     """Create a JWT access token"""
-    expiration = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
+    now = int(time.time())
     payload = {
         "user_id": user_id,
         "email": email,
-        "exp": expiration,
-        "iat": datetime.utcnow()
+        "exp": now + JWT_EXPIRATION_SECONDS,
+        "iat": now
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 
+# Clients send the same bearer token on every request, so decoded payloads
+# are kept briefly, keyed by a digest of the token. The expiry claim is still
+# checked on every hit.
+_token_cache = TTLCache(maxsize=50_000, ttl=30)
+_token_cache_lock = threading.Lock()
+
+# Digests of tokens revoked by /logout, mapped to the token's expiry. Only
+# tokens that verify are ever added, and entries are never evicted early;
+# they are pruned once the token has expired anyway.
+_revoked_tokens: dict[bytes, float] = {}
+_REVOKED_PRUNE_INTERVAL = 60
+_revoked_pruned_at = 0.0
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _revoke(key: bytes, expires_at: float):
+    """Record a verified token as revoked. Call with _token_cache_lock held."""
+    global _revoked_pruned_at
+    now = time.time()
+    if now - _revoked_pruned_at >= _REVOKED_PRUNE_INTERVAL:
+        for expired in [k for k, exp in _revoked_tokens.items() if exp <= now]:
+            del _revoked_tokens[expired]
+        _revoked_pruned_at = now
+    _token_cache.pop(key, None)
+    _revoked_tokens[key] = expires_at
+
+
+def _token_expired():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Token has expired"
+    )
+
+
 def verify_token(token: str) -> dict:
     """Verify and decode a JWT token"""
+    key = _token_key(token)
+    with _token_cache_lock:
+        if key in _revoked_tokens:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has been revoked"
+            )
+        payload = _token_cache.get(key)
+    if payload is not None:
+        if payload.get("exp", 0) <= time.time():
+            with _token_cache_lock:
+                _token_cache.pop(key, None)
+            raise _token_expired()
+        return payload
+
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = jwt.decode(token, JWT_SECRET, algorithms=_JWT_ALGORITHMS)
+        with _token_cache_lock:
+            _token_cache[key] = payload
         return payload
     except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired"
-        )
+        raise _token_expired()
     except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -63,14 +133,16 @@ def verify_token(token: str) -> dict:
         )
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+# Nothing here blocks: the token check is an HMAC (or a cache hit) and the
+# user check is an in-memory lookup. As an async dependency it runs on the
+# event loop instead of costing a threadpool hop on every request.
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """Dependency to get the current authenticated user"""
     token = credentials.credentials
     payload = verify_token(token)
 
     # Check if user still exists (important for in-memory storage)
-    user_email = payload.get("email")
-    if user_email not in TEMP_USERS:
+    if AUTH_STRICT_USER_CHECK and payload.get("email") not in TEMP_USERS:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User no longer exists. Please login again."
@@ -79,8 +151,25 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     return payload
 
 
+async def owned_ids(current_user: dict = Depends(get_current_user)) -> frozenset:
+    """Dependency: ids of the characters the current user owns.
+
+    FastAPI resolves a dependency once per request, so every ownership check
+    in a request shares this one lookup.
+    """
+    return await get_owned_character_ids_async(current_user["user_id"])
+
+
+class UserRec(NamedTuple):
+    user_id: str
+    email: str
+    password_hash: str
+    username: Optional[str]
+    neptune_synced: bool = False
+
+
 # Temporary in-memory user storage (replace with database in production)
-TEMP_USERS = {}
+TEMP_USERS: dict[str, UserRec] = {}
 
 
 @router.post("/register", response_model=TokenResponse)
@@ -94,28 +183,29 @@ def register(request: RegisterRequest):
                 detail="User with this email already exists"
             )
 
-        # In production, hash the password properly
-        import hashlib
-        password_hash = hashlib.sha256(request.password.encode()).hexdigest()
+        password_hash = User.hash_password(request.password)
 
         # Generate user ID
-        import uuid
         user_id = str(uuid.uuid4())
 
-        # Store user in TEMP_USERS (for authentication)
-        TEMP_USERS[request.email] = {
-            "user_id": user_id,
-            "email": request.email,
-            "password_hash": password_hash,
-            "username": request.username
-        }
+        # Store user in TEMP_USERS (for authentication). Registrations run on
+        # threadpool workers, so claim the email with a single setdefault:
+        # of two concurrent signups for one address, only one is stored.
+        new_user = UserRec(user_id, request.email, password_hash, request.username)
+        if TEMP_USERS.setdefault(request.email, new_user) is not new_user:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User with this email already exists"
+            )
 
         # ALSO create user in Neptune (for character relationships)
         neptune_success = create_user_in_neptune(user_id, request.email)
-        if not neptune_success:
-            print(f"Warning: Failed to create user {user_id} in Neptune, but continuing...")
+        if neptune_success:
+            TEMP_USERS[request.email] = new_user._replace(neptune_synced=True)
+        else:
+            logger.warning("Failed to create user %s in Neptune, but continuing", user_id)
 
-        print(f"Registered user: {request.email} with ID: {user_id}")  # Debug log
+        logger.debug("Registered user: %s with ID: %s", request.email, user_id)
 
         # Create access token
         access_token = create_access_token(user_id, request.email)
@@ -128,8 +218,8 @@ def register(request: RegisterRequest):
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error registering user: {e}")
+    except Exception:
+        logger.exception("Error registering user")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to register user"
@@ -140,47 +230,53 @@ def register(request: RegisterRequest):
 def login(username: str = Form(...), password: str = Form(...)):
     """Login with email and password - OAuth2 compatible"""
     try:
-        print(f"Login attempt for: {username}")  # Debug log
-        print(f"Current users in TEMP_USERS: {list(TEMP_USERS.keys())}")  # Debug log
+        logger.debug("Login attempt for: %s", username)
 
-        # Find user by email (username field contains email)
+        # Find user by email (username field contains email). Unknown emails
+        # still pay for a password check, so timing does not reveal them.
         user = TEMP_USERS.get(username)
         if not user:
+            verify_unknown_user_password(password)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
 
-        # Verify password (in production, use proper password verification)
-        import hashlib
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-
-        if password_hash != user["password_hash"]:
+        if not User.verify_password(password, user.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
 
-        # Ensure user exists in Neptune (in case they were created before this fix)
-        neptune_success = create_user_in_neptune(user["user_id"], user["email"])
-        if not neptune_success:
-            print(f"Warning: Failed to create/verify user {user['user_id']} in Neptune")
+        # Replace a legacy bcrypt hash, or one made with outdated Argon2
+        # parameters, while the password is at hand
+        new_hash = User.rehash_if_needed(password, user.password_hash)
+        if new_hash:
+            user = user._replace(password_hash=new_hash)
+            TEMP_USERS[user.email] = user
 
-        print(f"Successful login for: {username}")  # Debug log
+        # Ensure user exists in Neptune, if that did not succeed at signup
+        if not user.neptune_synced:
+            if create_user_in_neptune(user.user_id, user.email):
+                TEMP_USERS[user.email] = user._replace(neptune_synced=True)
+            else:
+                logger.warning("Failed to create/verify user %s in Neptune", user.user_id)
+
+        logger.debug("Successful login for: %s", username)
 
         # Create access token
-        access_token = create_access_token(user["user_id"], user["email"])
+        access_token = create_access_token(user.user_id, user.email)
 
         return TokenResponse(
             access_token=access_token,
             token_type="bearer",
-            user_id=user["user_id"]
+            user_id=user.user_id
         )
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error logging in user: {e}")
+    except Exception:
+        logger.exception("Error logging in user")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to login"
@@ -197,8 +293,12 @@ def get_current_user_info(current_user: dict = Depends(get_current_user)):
 
 
 @router.post("/logout")
-def logout():
-    """Logout (client should remove token)"""
+def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Logout (client should remove token). The token is revoked."""
+    token = credentials.credentials
+    payload = verify_token(token)
+    with _token_cache_lock:
+        _revoke(_token_key(token), payload["exp"])
     return {"message": "Logged out successfully"}
 
 
@@ -217,7 +317,6 @@ def debug_users():
 def debug_neptune_users():
     """Debug endpoint to see Neptune users"""
     try:
-        from app.neptune_client import run_query
         query = "g.V().hasLabel('User').elementMap()"
         result = run_query(query)
         return {
@@ -1,20 +1,34 @@
 # File: backend/app/routers/character.py
 # Fixed router prefix - should be "/api/character" not just "/character"
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, File, Request, Response, UploadFile
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+import logging
 from typing import Optional
 from app.models.character import (
     create_character,
     get_character,
+    get_character_image,
+    get_character_etag,
+    remember_character_etag,
     update_character as update_character_db,
+    update_character_image_bytes,
     delete_character,
     link_habits_with_character
 )
-from app.routers.auth import get_current_user  # Import auth dependency
-from app.models.user import link_character_to_user, get_user_characters
+from app.image_store import MAX_IMAGE_BYTES, shrink_image
+from app.routers.auth import get_current_user, owned_ids  # Import auth dependencies
+from app.models.user import (
+    link_character_to_user,
+    get_user_characters,
+    invalidate_owned_characters,
+)
 
 # FIXED: Use "/character" prefix since main.py already adds "/api"
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/character", tags=["character"])
 
 
@@ -76,8 +90,8 @@ def create_new_character(
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        print(f"Error creating character: {e}")
+    except Exception:
+        logger.exception("Error creating character")
         raise HTTPException(status_code=500, detail="Failed to create character")
 
 
@@ -86,47 +100,126 @@ def get_current_user_characters(current_user: dict = Depends(get_current_user)):
     """Get all characters for the authenticated user"""
     try:
         characters = get_user_characters(current_user["user_id"])
-        return {"status": "success", "data": characters}
-    except Exception as e:
-        print(f"Error fetching user characters: {e}")
+        # orjson serializes the CharacterRow dataclasses natively, so hand it
+        # the rows directly instead of going through jsonable_encoder
+        return ORJSONResponse({"status": "success", "data": characters})
+    except Exception:
+        logger.exception("Error fetching user characters")
         raise HTTPException(status_code=500, detail="Failed to fetch characters")
 
 
+async def owned_character_id(character_id: str, owned: frozenset = Depends(owned_ids)) -> str:
+    """Dependency: the path's character_id, after checking the user owns it"""
+    if character_id not in owned:
+        raise HTTPException(status_code=403, detail="You don't have access to this character")
+    return character_id
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+
 @router.get("/{character_id}")
-def read_character(character_id: str, current_user: dict = Depends(get_current_user)):
+async def read_character(
+        request: Request,
+        character_id: str = Depends(owned_character_id)
+):
     """Get a specific character (only if owned by user)"""
     try:
-        # Verify user owns this character
-        user_characters = get_user_characters(current_user["user_id"])
-        if not any(char["character_id"] == character_id for char in user_characters):
-            raise HTTPException(status_code=403, detail="You don't have access to this character")
+        # The client's copy is still current, so skip the Neptune read
+        etag = get_character_etag(character_id)
+        if etag and _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
 
-        character = get_character(character_id)
+        character = await get_character(character_id)
         if character:
-            return {"status": "success", "data": character}
+            payload = {"status": "success", "data": character}
+            etag = remember_character_etag(character_id, payload)
+            return ORJSONResponse(payload, headers={
+                "ETag": etag,
+                "Cache-Control": "private, no-cache",
+            })
         else:
             raise HTTPException(status_code=404, detail="Character not found")
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error fetching character: {e}")
+    except Exception:
+        logger.exception("Error fetching character")
         raise HTTPException(status_code=500, detail="Failed to fetch character")
 
 
+@router.get("/{character_id}/image")
+def read_character_image(character_id: str = Depends(owned_character_id)):
+    """Get a character's image (only if owned by user)"""
+    try:
+        image = get_character_image(character_id)
+        if not image:
+            raise HTTPException(status_code=404, detail="Character has no image")
+        return {"status": "success", "data": {"image_data": image}}
+
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Error fetching character image")
+        raise HTTPException(status_code=500, detail="Failed to fetch character image")
+
+
+_UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+async def _read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """Read an upload in chunks, raising 413 once it grows past max_bytes"""
+    buffer = bytearray()
+    while chunk := await file.read(_UPLOAD_CHUNK_BYTES):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise HTTPException(status_code=413, detail="Image file too large (max 5MB)")
+    return bytes(buffer)
+
+
+@router.post("/{character_id}/upload-image")
+async def upload_character_image(
+        file: UploadFile = File(...),
+        character_id: str = Depends(owned_character_id)
+):
+    """Upload a character image file (only if owned by user)"""
+    try:
+        if not file.content_type or not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        # Oversized uploads are rejected while reading, before all of it is buffered
+        content = await _read_upload(file, MAX_IMAGE_BYTES)
+
+        # The resize is CPU-bound, so it runs in the threadpool rather than
+        # on the event loop
+        try:
+            extension, content = await run_in_threadpool(shrink_image, content)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid image file")
+
+        # The bytes go to the image store as they are, with no base64 round trip
+        result = await run_in_threadpool(update_character_image_bytes, character_id, extension, content)
+        return {"status": "success", "data": {"image_url": result["image_url"]}}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("Error uploading character image")
+        raise HTTPException(status_code=500, detail="Failed to upload character image")
+
+
 @router.put("/{character_id}")
 def update_character(
-        character_id: str,
         update_data: CharacterUpdate,
-        current_user: dict = Depends(get_current_user)
+        character_id: str = Depends(owned_character_id)
 ):
     """Update a character (only if owned by user)"""
     try:
-        # Verify user owns this character
-        user_characters = get_user_characters(current_user["user_id"])
-        if not any(char["character_id"] == character_id for char in user_characters):
-            raise HTTPException(status_code=403, detail="You don't have access to this character")
-
         updated = update_character_db(character_id, update_data.image_data)
         if updated:
             return {"status": "success", "message": "Character updated"}
@@ -135,24 +228,20 @@ def update_character(
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error updating character: {e}")
+    except Exception:
+        logger.exception("Error updating character")
         raise HTTPException(status_code=500, detail="Failed to update character")
 
 
 @router.delete("/{character_id}")
 def delete_character_endpoint(
-        character_id: str,
+        character_id: str = Depends(owned_character_id),
         current_user: dict = Depends(get_current_user)
 ):
     """Delete a character (only if owned by user)"""
     try:
-        # Verify user owns this character
-        user_characters = get_user_characters(current_user["user_id"])
-        if not any(char["character_id"] == character_id for char in user_characters):
-            raise HTTPException(status_code=403, detail="You don't have access to this character")
-
         success = delete_character(character_id)
+        invalidate_owned_characters(current_user["user_id"])
         if success:
             return {"status": "success", "message": "Character deleted"}
         else:
@@ -160,6 +249,6 @@ def delete_character_endpoint(
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error deleting character: {e}")
+    except Exception:
+        logger.exception("Error deleting character")
         raise HTTPException(status_code=500, detail="Failed to delete character")
\ No newline at end of file
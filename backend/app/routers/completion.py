@@ -3,16 +3,21 @@
 
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime, date, timedelta
+import logging
+from typing import List, Tuple
+from datetime import date, timedelta
+from functools import lru_cache
 from app.models.habit import (
     update_habit_completion,  # Import from habit model, not completion model
-    get_habit,
+    update_habit_completions,
+    get_habit_character_id,
+    get_habit_character_ids,
     get_current_week_completions,
     get_current_day_completions
 )
-from app.routers.auth import get_current_user
-from app.models.user import get_user_characters
+from app.routers.auth import owned_ids
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/habit", tags=["completion"])
 
@@ -23,22 +28,31 @@ class CompletionMark(BaseModel):
     completed: bool = True
 
 
-def verify_habit_ownership(habit_id: str, user_id: str) -> bool:
-    """Verify that a user owns the character that owns this habit"""
-    habit = get_habit(habit_id)
-    if not habit:
-        return False
+def get_today() -> date:
+    """Today's date, resolved once per request"""
+    return date.today()
+
+
+@lru_cache(maxsize=1)
+def _week_range(day: date) -> Tuple[date, date]:
+    """Monday and Sunday of the week containing day, computed once per day"""
+    start_of_week = day - timedelta(days=day.weekday())
+    return start_of_week, start_of_week + timedelta(days=6)
+
 
-    user_characters = get_user_characters(user_id)
-    return any(char["character_id"] == habit["character_id"] for char in user_characters)
+def verify_habit_ownership(habit_id: str, owned: frozenset) -> bool:
+    """Verify that this habit's character is one the user owns"""
+    # Only the habit's character is needed, and that lookup is cached
+    character_id = get_habit_character_id(habit_id)
+    return character_id is not None and character_id in owned
 
 
 @router.post("/completion")
-def mark_completion(completion: CompletionMark, current_user: dict = Depends(get_current_user)):
+def mark_completion(completion: CompletionMark, owned: frozenset = Depends(owned_ids)):
     """Mark a habit as complete or incomplete for a specific date"""
     try:
         # Verify user owns this habit's character
-        if not verify_habit_ownership(completion.habit_id, current_user["user_id"]):
+        if not verify_habit_ownership(completion.habit_id, owned):
             raise HTTPException(status_code=403, detail="You don't have access to this habit")
 
         # Use update_habit_completion from habit model
@@ -57,29 +71,49 @@ def mark_completion(completion: CompletionMark, current_user: dict = Depends(get
         raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        print(f"Error marking completion: {e}")
+    except Exception:
+        logger.exception("Error marking completion")
         raise HTTPException(status_code=500, detail="Failed to mark completion")
 
 
+@router.post("/completion/batch")
+def mark_completions(completions: List[CompletionMark], owned: frozenset = Depends(owned_ids)):
+    """Mark several habits complete or incomplete at once, e.g. at the end of a day"""
+    try:
+        # Verify user owns every habit's character, looked up in one go
+        habit_ids = {completion.habit_id for completion in completions}
+        character_ids = get_habit_character_ids(habit_ids)
+        if any(character_ids.get(habit_id) not in owned for habit_id in habit_ids):
+            raise HTTPException(status_code=403, detail="You don't have access to this habit")
+
+        result = update_habit_completions([completion.model_dump() for completion in completions])
+        return {"status": "success", "message": "Completions marked", "data": result}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("Error marking completions")
+        raise HTTPException(status_code=500, detail="Failed to mark completions")
+
+
 @router.get("/completions/week/{character_id}")
-def get_week_completions(
+async def get_week_completions(
         character_id: str,
-        current_user: dict = Depends(get_current_user)
+        today: date = Depends(get_today),
+        owned: frozenset = Depends(owned_ids)
 ):
     """Get habit completions for the current week"""
     try:
         # Verify user owns this character
-        user_characters = get_user_characters(current_user["user_id"])
-        if not any(char["character_id"] == character_id for char in user_characters):
+        if character_id not in owned:
             raise HTTPException(status_code=403, detail="You don't have access to this character")
 
         # Calculate current week's start and end dates
-        today = datetime.now().date()
-        start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
+        start_of_week, end_of_week = _week_range(today)
 
-        completions = get_current_week_completions(
+        completions = await get_current_week_completions(
             character_id=character_id,
             start_date=start_of_week,
             end_date=end_of_week
@@ -89,25 +123,24 @@ def get_week_completions(
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error fetching week completions: {e}")
+    except Exception:
+        logger.exception("Error fetching week completions")
         raise HTTPException(status_code=500, detail="Failed to fetch completions")
 
 
 @router.get("/completions/today/{character_id}")
-def get_today_completions(
+async def get_today_completions(
         character_id: str,
-        current_user: dict = Depends(get_current_user)
+        today: date = Depends(get_today),
+        owned: frozenset = Depends(owned_ids)
 ):
     """Get habit completions for today"""
     try:
         # Verify user owns this character
-        user_characters = get_user_characters(current_user["user_id"])
-        if not any(char["character_id"] == character_id for char in user_characters):
+        if character_id not in owned:
             raise HTTPException(status_code=403, detail="You don't have access to this character")
 
-        today = datetime.now().date()
-        completions = get_current_day_completions(
+        completions = await get_current_day_completions(
             character_id=character_id,
             today=today
         )
@@ -116,6 +149,6 @@ def get_today_completions(
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error fetching today's completions: {e}")
+    except Exception:
+        logger.exception("Error fetching today's completions")
         raise HTTPException(status_code=500, detail="Failed to fetch completions")
\ No newline at end of file
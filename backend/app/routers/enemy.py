@@ -1,8 +1,12 @@
 # File: backend/app/routers/enemy.py
 # API endpoints for enemy management
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
+import hashlib
+import logging
+import orjson
+from enum import Enum
 from typing import List, Dict, Optional
 from app.models.enemy import (
     create_enemy_templates,
@@ -16,9 +20,25 @@ from app.models.enemy import (
     delete_enemy_template
 )
 
+logger = logging.getLogger(__name__)
+
+# Template reads are conditional GETs. Each encoded response is kept with
+# the data it was built from and only re-encoded (with a new ETag) when the
+# model returns different data. The model hands out copies, so this compares
+# by value; that is much cheaper than encoding again.
+_TEMPLATE_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+_encoded_responses: dict = {}
+
 router = APIRouter(tags=["enemy"])
 
 
+class Difficulty(str, Enum):
+    easy = "Easy"
+    medium = "Medium"
+    hard = "Hard"
+    legendary = "Legendary"
+
+
 class EnemyTemplateCreateRequest(BaseModel):
     enemy_id: str
     name: str
@@ -44,6 +64,32 @@ class EnemyTemplateUpdateRequest(BaseModel):
     environment: Optional[List[str]] = None
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in tags or "*" in tags
+
+
+def _template_response(request: Request, key, source, build) -> Response:
+    """JSON response for build(source) with an ETag, or a 304 if the client's copy is current"""
+    cached = _encoded_responses.get(key)
+    if cached is None or cached[0] != source:
+        body = orjson.dumps(build(source))
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        cached = _encoded_responses[key] = (source, body, etag)
+
+    _, body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": _TEMPLATE_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _success(data) -> dict:
+    return {"status": "success", "data": data}
+
+
 @router.post("/enemy/initialize", summary="Initialize default enemy templates")
 def initialize_enemy_templates():
     """
@@ -57,26 +103,28 @@ def initialize_enemy_templates():
             "message": f"Initialized {len(result)} enemy templates",
             "data": result
         }
-    except Exception as e:
-        print(f"Error initializing enemy templates: {e}")
+    except Exception:
+        logger.exception("Error initializing enemy templates")
         raise HTTPException(status_code=500, detail="Failed to initialize enemy templates")
 
 
 @router.get("/enemy/templates", summary="Get all enemy templates")
-def get_enemy_templates():
+def get_enemy_templates(request: Request):
     """
     Retrieve all available enemy templates.
     """
     try:
         templates = get_all_enemy_templates()
-        return {"status": "success", "data": templates}
-    except Exception as e:
-        print(f"Error fetching enemy templates: {e}")
+        # Templates are plain dicts, so orjson can encode them as they are
+        # without a jsonable_encoder pass
+        return _template_response(request, "templates", templates, _success)
+    except Exception:
+        logger.exception("Error fetching enemy templates")
         raise HTTPException(status_code=500, detail="Failed to fetch enemy templates")
 
 
 @router.get("/enemy/template/{enemy_id}", summary="Get specific enemy template")
-def get_specific_enemy_template(enemy_id: str):
+def get_specific_enemy_template(enemy_id: str, request: Request):
     """
     Retrieve a specific enemy template by ID.
     """
@@ -84,34 +132,25 @@ def get_specific_enemy_template(enemy_id: str):
         template = get_enemy_template(enemy_id)
         if not template:
             raise HTTPException(status_code=404, detail="Enemy template not found")
-        return {"status": "success", "data": template}
+        return _template_response(request, ("template", enemy_id), template, _success)
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error fetching enemy template {enemy_id}: {e}")
+    except Exception:
+        logger.exception("Error fetching enemy template %s", enemy_id)
         raise HTTPException(status_code=500, detail="Failed to fetch enemy template")
 
 
 @router.get("/enemy/difficulty/{difficulty}", summary="Get enemies by difficulty")
-def get_enemies_by_difficulty_level(difficulty: str):
+def get_enemies_by_difficulty_level(difficulty: Difficulty):
     """
     Get enemy templates filtered by difficulty level.
     Valid difficulties: Easy, Medium, Hard, Legendary
     """
     try:
-        valid_difficulties = ["Easy", "Medium", "Hard", "Legendary"]
-        if difficulty not in valid_difficulties:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid difficulty. Must be one of: {valid_difficulties}"
-            )
-
-        enemies = get_enemies_by_difficulty(difficulty)
+        enemies = get_enemies_by_difficulty(difficulty.value)
         return {"status": "success", "data": enemies}
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Error fetching enemies by difficulty {difficulty}: {e}")
+    except Exception:
+        logger.exception("Error fetching enemies by difficulty %s", difficulty.value)
         raise HTTPException(status_code=500, detail="Failed to fetch enemies by difficulty")
 
 
@@ -124,8 +163,8 @@ def get_enemies_by_environment_type(environment: str):
     try:
         enemies = get_enemies_by_environment(environment)
         return {"status": "success", "data": enemies}
-    except Exception as e:
-        print(f"Error fetching enemies by environment {environment}: {e}")
+    except Exception:
+        logger.exception("Error fetching enemies by environment %s", environment)
         raise HTTPException(status_code=500, detail="Failed to fetch enemies by environment")
 
 
@@ -145,8 +184,8 @@ def create_combat_enemy_instance(
         return {"status": "success", "data": instance}
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error creating enemy instance: {e}")
+    except Exception:
+        logger.exception("Error creating enemy instance")
         raise HTTPException(status_code=500, detail="Failed to create enemy instance")
 
 
@@ -156,15 +195,15 @@ def create_new_enemy_template(enemy: EnemyTemplateCreateRequest):
     Create a new custom enemy template.
     """
     try:
-        enemy_data = enemy.dict()
+        enemy_data = enemy.model_dump()
         result = create_enemy_template(enemy_data)
         if not result:
             raise HTTPException(status_code=500, detail="Failed to create enemy template")
         return {"status": "success", "data": result}
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error creating enemy template: {e}")
+    except Exception:
+        logger.exception("Error creating enemy template")
         raise HTTPException(status_code=500, detail="Failed to create enemy template")
 
 
@@ -176,7 +215,7 @@ def update_existing_enemy_template(enemy_id: str, updates: EnemyTemplateUpdateRe
     """
     try:
         # Filter out None values
-        update_data = {k: v for k, v in updates.dict().items() if v is not None}
+        update_data = updates.model_dump(exclude_none=True)
 
         if not update_data:
             raise HTTPException(status_code=400, detail="No valid updates provided")
@@ -188,8 +227,8 @@ def update_existing_enemy_template(enemy_id: str, updates: EnemyTemplateUpdateRe
         return {"status": "success", "data": result}
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error updating enemy template {enemy_id}: {e}")
+    except Exception:
+        logger.exception("Error updating enemy template %s", enemy_id)
         raise HTTPException(status_code=500, detail="Failed to update enemy template")
 
 
@@ -206,41 +245,46 @@ def delete_existing_enemy_template(enemy_id: str):
         return {"status": "success", "message": f"Enemy template {enemy_id} deleted successfully"}
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error deleting enemy template {enemy_id}: {e}")
+    except Exception:
+        logger.exception("Error deleting enemy template %s", enemy_id)
         raise HTTPException(status_code=500, detail="Failed to delete enemy template")
 
 
+def _combat_enemies(templates: List[Dict]) -> dict:
+    """Templates in the format expected by the existing frontend"""
+    # Build the id list and the template map in one pass
+    available_enemies = []
+    enemy_templates = {}
+    for template in templates:
+        short_id = template['enemy_id'].replace('template_', '')
+        available_enemies.append(short_id)
+        enemy_templates[short_id] = {
+            "name": template['name'],
+            "level": template['level'],
+            "maxHp": template['max_hp'],
+            "dicePool": template['dice_pool'],
+            "xpReward": template['xp_reward'],
+            "lootTable": template['loot_table'],
+            "description": template['description']
+        }
+
+    return {
+        "status": "success",
+        "available_enemies": available_enemies,
+        "enemy_templates": enemy_templates
+    }
+
+
 # Legacy compatibility endpoint for the existing adventure system
 @router.get("/enemy/available", summary="Get available enemies for combat selection")
-def get_available_enemies_for_combat():
+def get_available_enemies_for_combat(request: Request):
     """
     Legacy endpoint that returns available enemies in the format expected by the existing combat system.
     This maintains compatibility while transitioning to the new database-driven system.
     """
     try:
         templates = get_all_enemy_templates()
-
-        # Convert to the format expected by the existing frontend
-        available_enemies = []
-        for template in templates:
-            available_enemies.append(template['enemy_id'].replace('template_', ''))
-
-        return {
-            "status": "success",
-            "available_enemies": available_enemies,
-            "enemy_templates": {
-                template['enemy_id'].replace('template_', ''): {
-                    "name": template['name'],
-                    "level": template['level'],
-                    "maxHp": template['max_hp'],
-                    "dicePool": template['dice_pool'],
-                    "xpReward": template['xp_reward'],
-                    "lootTable": template['loot_table'],
-                    "description": template['description']
-                } for template in templates
-            }
-        }
-    except Exception as e:
-        print(f"Error fetching available enemies: {e}")
-        raise HTTPException(status_code=500, detail="Failed to fetch available enemies")
\ No newline at end of file
+        return _template_response(request, "available", templates, _combat_enemies)
+    except Exception:
+        logger.exception("Error fetching available enemies")
+        raise HTTPException(status_code=500, detail="Failed to fetch available enemies")
@@ -2,16 +2,21 @@
 # Update habit router to require authentication
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Optional
+import logging
+from typing import List, Optional
+from datetime import date
 from app.models.habit import (
     create_habit as create_habit_db,
+    create_habits_bulk,
     get_all_habits,
     delete_habit as delete_habit_db,
-    get_habit_by_id
+    get_habit_character_id
 )
-from app.routers.auth import get_current_user
-from app.models.user import get_user_characters
+from app.routers.auth import owned_ids
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/habit", tags=["habit"])
 
@@ -23,18 +28,12 @@ class HabitCreate(BaseModel):
     description: Optional[str] = None
 
 
-def verify_character_ownership(character_id: str, user_id: str) -> bool:
-    """Verify that a user owns a specific character"""
-    user_characters = get_user_characters(user_id)
-    return any(char["character_id"] == character_id for char in user_characters)
-
-
 @router.post("")
-def create_habit(habit: HabitCreate, current_user: dict = Depends(get_current_user)):
+def create_habit(habit: HabitCreate, owned: frozenset = Depends(owned_ids)):
     """Create a new habit for a character"""
     try:
         # Verify user owns this character
-        if not verify_character_ownership(habit.character_id, current_user["user_id"]):
+        if habit.character_id not in owned:
             raise HTTPException(status_code=403, detail="You don't have access to this character")
 
         result = create_habit_db(
@@ -49,39 +48,77 @@ def create_habit(habit: HabitCreate, current_user: dict = Depends(get_current_us
         raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        print(f"Error creating habit: {e}")
+    except Exception:
+        logger.exception("Error creating habit")
         raise HTTPException(status_code=500, detail="Failed to create habit")
 
 
+@router.post("/bulk")
+def create_habits(habits: List[HabitCreate], owned: frozenset = Depends(owned_ids)):
+    """Create several habits at once, e.g. when importing"""
+    try:
+        # Verify user owns every character the habits are for
+        if any(habit.character_id not in owned for habit in habits):
+            raise HTTPException(status_code=403, detail="You don't have access to this character")
+
+        result = create_habits_bulk([habit.model_dump() for habit in habits])
+        if result["missing_character_ids"]:
+            # A character was deleted after the ownership check
+            if not result["habit_ids"]:
+                raise HTTPException(status_code=404, detail="Character not found")
+            return ORJSONResponse(status_code=207, content={
+                "status": "partial",
+                "habit_ids": result["habit_ids"],
+                "missing_character_ids": result["missing_character_ids"],
+                "data": result,
+            })
+        return {"status": "success", "habit_ids": result["habit_ids"], "data": result}
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception("Error creating habits")
+        raise HTTPException(status_code=500, detail="Failed to create habits")
+
+
 @router.get("/character/{character_id}")
-def get_habits(character_id: str, current_user: dict = Depends(get_current_user)):
-    """Get all habits for a character"""
+async def get_habits(
+    character_id: str,
+    selected_date: Optional[date] = None,
+    owned: frozenset = Depends(owned_ids)
+):
+    """Get all habits for a character.
+
+    Pass selected_date to get only that day's completed flag per habit
+    instead of every completion date.
+    """
     try:
         # Verify user owns this character
-        if not verify_character_ownership(character_id, current_user["user_id"]):
+        if character_id not in owned:
             raise HTTPException(status_code=403, detail="You don't have access to this character")
 
-        habits = get_all_habits(character_id)
+        habits = await get_all_habits(character_id, selected_date)
         return {"status": "success", "data": habits}
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error fetching habits: {e}")
+    except Exception:
+        logger.exception("Error fetching habits")
         raise HTTPException(status_code=500, detail="Failed to fetch habits")
 
 
 @router.delete("/{habit_id}")
-def delete_habit(habit_id: str, current_user: dict = Depends(get_current_user)):
+def delete_habit(habit_id: str, owned: frozenset = Depends(owned_ids)):
     """Delete a habit"""
     try:
         # Verify the habit belongs to a character owned by the user
-        habit = get_habit_by_id(habit_id)
-        if not habit:
+        character_id = get_habit_character_id(habit_id)
+        if character_id is None:
             raise HTTPException(status_code=404, detail="Habit not found")
 
-        if not verify_character_ownership(habit["character_id"], current_user["user_id"]):
+        if character_id not in owned:
             raise HTTPException(status_code=403, detail="You don't have access to this habit")
 
         result = delete_habit_db(habit_id)
@@ -89,6 +126,6 @@ def delete_habit(habit_id: str, current_user: dict = Depends(get_current_user)):
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Error deleting habit: {e}")
+    except Exception:
+        logger.exception("Error deleting habit")
         raise HTTPException(status_code=500, detail="Failed to delete habit")
\ No newline at end of file